@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import dj_database_url
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,10 +51,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.compression.CompressionMiddleware',
+    'core.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.audit.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,10 +69,43 @@ REST_FRAMEWORK = {
         "rest_framework.filters.SearchFilter",
         "rest_framework.filters.OrderingFilter",
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "core.pagination.PageSizePagination",
     "PAGE_SIZE": 25,
+    # orjson replaces the stock JSON renderer/parser and MessagePack is offered
+    # (Accept: application/msgpack or ?format=msgpack)
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "core.renderers.MessagePackRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+        "core.renderers.MessagePackParser",
+    ],
 }
 
+# Response compression (core.compression): gzip, or brotli when accepted and installed.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 4
+
+# Cache (facet counts, core.facets). With REDIS_URL every worker shares one cache;
+# without it each process keeps its own LocMemCache, so a count is computed once
+# per worker rather than once per deployment (still correct: keys carry the catalog version).
+if os.environ.get("REDIS_URL"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": os.environ["REDIS_URL"]}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+FACET_CACHE_SECONDS = 300
+
+# Stock alerts (core.alerts): low-stock level used when a variant has no StockThreshold
+# (None = only alert where a threshold is set), and editions-remaining level for limited editions.
+LOW_STOCK_DEFAULT = None
+EDITION_ALERT_REMAINING = 3
+
+# Sales tax (core.tax): jurisdiction for orders that do not set one, e.g. "US-CA" ("" = no tax).
+TAX_DEFAULT_JURISDICTION = os.environ.get("TAX_DEFAULT_JURISDICTION", "")
 
 ROOT_URLCONF = 'config.urls'
 
@@ -90,17 +130,52 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DATABASE_URL wins when set (Render provides it); the local dev database is the fallback.
+# No password in the fallback: libpq takes it from PGPASSWORD or ~/.pgpass.
 DATABASES = {
-    'default': {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "artdb",
-        "USER": "artuser",
-        "PASSWORD": "ArtPass!234",
-        "HOST": "127.0.0.1",
-        "PORT": "5432",
-    }
+    'default': dj_database_url.config(
+        default="postgres://artuser@127.0.0.1:5432/artdb",
+        conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", "600")),
+        conn_health_checks=True,
+    )
 }
 
+# Optional read replicas, comma-separated URLs -> aliases replica, replica_2, ...
+# core.db_router sends safe (GET/HEAD) request reads there; "default" stays the
+# fallback and takes every write. Two SQLite files work for local testing:
+#   DATABASE_URL=sqlite:///primary.db DATABASE_REPLICA_URLS=sqlite:///replica.db
+REPLICA_DATABASES = []
+for _i, _url in enumerate(u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()):
+    _alias = "replica" if _i == 0 else f"replica_{_i + 1}"
+    DATABASES[_alias] = dj_database_url.parse(
+        _url,
+        conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", "600")),
+        conn_health_checks=True,
+        test_options={"MIRROR": "default"},
+    )
+    REPLICA_DATABASES.append(_alias)
+DATABASE_ROUTERS = ["core.db_router.ReplicaRouter"]
+# how long a client keeps reading from the primary after it writes (> replication lag)
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", "5"))
+
+# psycopg 3 connection pool (Django 5.1+). Each gunicorn worker gets its own
+# pool per database sized to its thread count, so each server sees at most
+# WEB_CONCURRENCY * DB_POOL_MAX_SIZE connections. Pooling replaces
+# persistent connections, so CONN_MAX_AGE must be 0 when it is on.
+# Pooled connections are health-checked by Django before being handed out.
+if os.environ.get("DB_POOL", "1") == "1":
+    _threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+    for _db in DATABASES.values():
+        if _db['ENGINE'] != "django.db.backends.postgresql":
+            continue
+        _db['CONN_MAX_AGE'] = 0
+        _db.setdefault('OPTIONS', {})['pool'] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", str(max(2, _threads)))),
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            "max_idle": 300,
+        }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,6 +202,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"   # => C:\ArtBiz\media
 
+# Resumable chunked uploads (core.uploads): partial files live here, outside
+# MEDIA_ROOT so they are never served; keep it on the same volume so the
+# finished file is renamed into place rather than copied.
+CHUNKED_UPLOAD_DIR = Path(os.environ.get("CHUNKED_UPLOAD_DIR", BASE_DIR / "upload_chunks"))
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get("CHUNKED_UPLOAD_MAX_SIZE", 2 * 1024 ** 3))
+
+# Perceptual hashes (core.phash): images up to this size are fingerprinted right
+# after the Media save commits; bigger scans are left to `manage.py cluster_media`
+# (run it from cron) so a web worker never decodes a multi-GB TIFF.
+MEDIA_FINGERPRINT_INLINE_MAX_SIZE = int(os.environ.get("MEDIA_FINGERPRINT_INLINE_MAX_SIZE", 32 * 1024 ** 2))
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -143,6 +230,15 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Static: WhiteNoise serves `collectstatic` output with gzip/brotli variants and
+# hashed names (Cache-Control: immutable). Media: uploads are content-hashed so
+# their URLs can be cached forever too (see core.storage / core.views.serve_media).
+STORAGES = {
+    "default": {"BACKEND": "core.storage.HashedMediaStorage"},
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -0,0 +1,26 @@
+"""
+Production profile: config.settings minus everything a JSON-only API server
+doesn't need at boot. gunicorn.conf.py selects it unless DJANGO_SETTINGS_MODULE
+is set.
+
+- no browsable API, so the rest_framework and django_filters apps (which only
+  contribute its templates and static files) are not installed and neither
+  package is imported by django.setup(); the API views still import them
+  when the urlconf loads, in the preloaded gunicorn master.
+- Pillow is only imported on the media paths (core.uploads, core.phash).
+
+Compare with `python manage.py profile_startup --settings=config.settings_production`.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, REST_FRAMEWORK
+
+DEBUG = False
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ("rest_framework", "django_filters")]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    "DEFAULT_RENDERER_CLASSES": [
+        r for r in REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] if r != "rest_framework.renderers.BrowsableAPIRenderer"
+    ],
+}
@@ -17,14 +17,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from core.views import serve_media
 urlpatterns = [
     path("", lambda request: HttpResponse("✅ ArtBiz is live!"), name="home"),
     path("admin/", admin.site.urls),
-    
+    path("", include("core.urls")),
+    # uploaded files (range requests + sendfile); static files are served by WhiteNoise
+    re_path(r"^%s(?P<path>.*)$" % settings.MEDIA_URL.lstrip("/"), serve_media, name="media"),
 ]
-# dev-only: serves uploaded files
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -99,6 +99,20 @@ class InventoryByLocationAdmin(admin.ModelAdmin):
     list_filter = ("location",)
 
 
+@admin.register(models.StockThreshold)
+class StockThresholdAdmin(admin.ModelAdmin):
+    list_display = ("variant", "location", "low_stock_at", "edition_remaining_at")
+    search_fields = ("variant__option_label", "variant__product__title", "location__name")
+
+
+@admin.register(models.StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ("kind", "variant", "location", "value", "threshold", "created_at", "resolved_at")
+    list_filter = ("kind", "location")
+    search_fields = ("variant__option_label", "variant__product__title")
+    date_hierarchy = "created_at"
+
+
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ("id", "status", "channel", "total_cents", "buyer_contact", "created_at", "paid_at")
@@ -108,6 +122,13 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline]
 
 
+@admin.register(models.TaxRate)
+class TaxRateAdmin(admin.ModelAdmin):
+    list_display = ("jurisdiction", "product_type", "rate", "valid_from", "updated_at")
+    list_filter = ("product_type",)
+    search_fields = ("jurisdiction",)
+
+
 @admin.register(models.Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ("order", "method", "amount_cents", "received_at")
@@ -0,0 +1,144 @@
+"""
+Low-stock and edition-sellout alerts.
+
+Evaluation is incremental: it listens to sync.changes_recorded, which fires
+for every committed change to inventory or variants (single saves, batch
+ingestion, transfers, counts), and only looks at the rows in that change.
+Each condition has at most one open StockAlert; it is updated while the
+condition holds and resolved once it clears. Changing a StockThreshold, or a
+Location's is_sellable, re-evaluates just the variant or location affected.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import models, sync
+
+Kind = models.StockAlert.Kind
+
+
+def _reconcile(kind, touched, breaches):
+    """
+    touched: the (variant_id, location_id|None) conditions just re-evaluated.
+    breaches: {key: (value, threshold)} for those currently violated.
+    Opens, refreshes or resolves alerts for the touched keys only.
+    """
+    now = timezone.now()
+    existing = {
+        (a.variant_id, a.location_id): a
+        for a in models.StockAlert.objects.filter(
+            kind=kind, variant_id__in={v for v, _ in touched}, resolved_at__isnull=True,
+        )
+        if (a.variant_id, a.location_id) in touched
+    }
+    to_update, to_resolve = [], []
+    for key, alert in existing.items():
+        if key not in breaches:
+            to_resolve.append(alert.pk)
+            continue
+        value, threshold = breaches[key]
+        if (alert.value, alert.threshold) != (value, threshold):
+            alert.value, alert.threshold, alert.updated_at = value, threshold, now
+            to_update.append(alert)
+
+    models.StockAlert.objects.bulk_create(
+        [
+            models.StockAlert(kind=kind, variant_id=v, location_id=l, value=value, threshold=threshold,
+                              created_at=now, updated_at=now)
+            for (v, l), (value, threshold) in breaches.items() if (v, l) not in existing
+        ],
+        ignore_conflicts=True,  # a concurrent evaluation may have opened it first
+    )
+    if to_update:
+        models.StockAlert.objects.bulk_update(to_update, ["value", "threshold", "updated_at"])
+    if to_resolve:
+        models.StockAlert.objects.filter(pk__in=to_resolve).update(resolved_at=now)
+
+
+def evaluate_inventory(inventory_ids):
+    rows = list(
+        models.InventoryByLocation.objects.filter(pk__in=inventory_ids)
+        .values_list("variant_id", "location_id", "on_hand", "location__is_sellable")
+    )
+    if not rows:
+        return
+    variant_ids = {r[0] for r in rows}
+    thresholds = {
+        (v, l): level
+        for v, l, level in models.StockThreshold.objects.filter(
+            Q(location__isnull=True) | Q(location_id__in={r[1] for r in rows}),
+            variant_id__in=variant_ids, low_stock_at__isnull=False,
+        ).values_list("variant_id", "location_id", "low_stock_at")
+    }
+    default = getattr(settings, "LOW_STOCK_DEFAULT", None)
+
+    breaches = {}
+    for v, l, on_hand, sellable in rows:
+        level = thresholds.get((v, l), thresholds.get((v, None), default))
+        if sellable and level is not None and on_hand <= level:
+            breaches[(v, l)] = (on_hand, level)
+    _reconcile(Kind.LOW_STOCK, {(r[0], r[1]) for r in rows}, breaches)
+
+
+def evaluate_variants(variant_ids):
+    rows = list(models.ProductVariant.objects.filter(pk__in=variant_ids).values_list("pk", "edition_size", "edition_sold"))
+    if not rows:
+        return
+    overrides = dict(
+        models.StockThreshold.objects.filter(
+            variant_id__in=[r[0] for r in rows], location__isnull=True, edition_remaining_at__isnull=False,
+        ).values_list("variant_id", "edition_remaining_at")
+    )
+    default = getattr(settings, "EDITION_ALERT_REMAINING", 3)
+
+    breaches = {}
+    for pk, size, sold in rows:
+        if size is None:
+            continue  # open edition
+        remaining = max(size - sold, 0)
+        level = overrides.get(pk, default)
+        if remaining <= level:
+            breaches[(pk, None)] = (remaining, level)
+    _reconcile(Kind.EDITION_SELLOUT, {(r[0], None) for r in rows}, breaches)
+
+
+def _on_changes(sender, ids, deleted, **kwargs):
+    if deleted:
+        return  # alert rows cascade with their variant/inventory
+    if sender is models.InventoryByLocation:
+        evaluate_inventory(ids)
+    elif sender is models.ProductVariant:
+        evaluate_variants(ids)
+
+
+def _on_threshold_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    variant_id, location_id = instance.variant_id, instance.location_id
+
+    def evaluate():
+        inventory = models.InventoryByLocation.objects.filter(variant_id=variant_id)
+        if location_id is not None:
+            inventory = inventory.filter(location_id=location_id)
+        evaluate_inventory(inventory.values("pk"))
+        evaluate_variants([variant_id])
+
+    transaction.on_commit(evaluate)
+
+
+def _on_location_save(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return  # a new location has no inventory yet
+    location_id = instance.pk
+    transaction.on_commit(
+        lambda: evaluate_inventory(models.InventoryByLocation.objects.filter(location_id=location_id).values("pk"))
+    )
+
+
+def connect_signals():
+    sync.changes_recorded.connect(_on_changes, dispatch_uid="stock-alerts")
+    post_save.connect(_on_threshold_change, sender=models.StockThreshold, dispatch_uid="stock-alerts-threshold-save")
+    post_delete.connect(_on_threshold_change, sender=models.StockThreshold, dispatch_uid="stock-alerts-threshold-delete")
+    post_save.connect(_on_location_save, sender=models.Location, dispatch_uid="stock-alerts-location")
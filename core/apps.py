@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import alerts, audit, phash, sync
+        sync.connect_signals()
+        audit.connect_signals()
+        alerts.connect_signals()
+        phash.connect_signals()
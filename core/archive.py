@@ -0,0 +1,88 @@
+"""
+Move closed orders (with their items and payments) and old CRM notes from
+the hot tables into the Archived* tables, one batch per transaction.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import models
+
+CLOSED_STATUSES = (models.Order.Status.FULFILLED, models.Order.Status.CANCELLED, models.Order.Status.REFUNDED)
+DEFAULT_BATCH = 1000
+
+
+def cutoff_for(years):
+    return timezone.now() - timedelta(days=round(365.25 * years))
+
+
+def _move_orders(ids):
+    orders = list(models.Order.objects.filter(pk__in=ids).select_related("buyer_contact"))
+    items = list(models.OrderItem.objects.filter(order_id__in=ids).select_related("variant__product"))
+    payments = list(models.Payment.objects.filter(order_id__in=ids))
+
+    models.ArchivedOrder.objects.bulk_create([
+        models.ArchivedOrder(
+            id=o.pk, buyer_contact=o.buyer_contact_id,
+            buyer_name=o.buyer_contact.name if o.buyer_contact else None,
+            channel=o.channel, consignment=o.consignment_id, status=o.status,
+            subtotal_cents=o.subtotal_cents, tax_cents=o.tax_cents, shipping_cents=o.shipping_cents,
+            total_cents=o.total_cents, created_at=o.created_at, paid_at=o.paid_at, client_key=o.client_key,
+            tax_jurisdiction=o.tax_jurisdiction,
+        )
+        for o in orders
+    ])
+    models.ArchivedOrderItem.objects.bulk_create([
+        models.ArchivedOrderItem(
+            id=i.pk, order_id=i.order_id, variant=i.variant_id,
+            variant_label=i.variant.option_label, product_title=i.variant.product.title,
+            qty=i.qty, unit_price_cents=i.unit_price_cents,
+        )
+        for i in items
+    ])
+    models.ArchivedPayment.objects.bulk_create([
+        models.ArchivedPayment(
+            id=p.pk, order_id=p.order_id, method=p.method, amount_cents=p.amount_cents, received_at=p.received_at,
+        )
+        for p in payments
+    ])
+    # children first so the Order delete has nothing left to cascade
+    models.OrderItem.objects.filter(order_id__in=ids).delete()
+    models.Payment.objects.filter(order_id__in=ids).delete()
+    models.Order.objects.filter(pk__in=ids).delete()
+    return len(orders)
+
+
+def archive_orders(cutoff, batch_size=DEFAULT_BATCH, dry_run=False):
+    """Archive closed orders created before `cutoff`; returns how many were (or would be) moved."""
+    candidates = models.Order.objects.filter(status__in=CLOSED_STATUSES, created_at__lt=cutoff).order_by("pk")
+    if dry_run:
+        return candidates.count()
+    moved = 0
+    while True:
+        ids = list(candidates.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return moved
+        with transaction.atomic():
+            moved += _move_orders(ids)
+
+
+def archive_crm_notes(cutoff, batch_size=DEFAULT_BATCH, dry_run=False):
+    candidates = models.CrmNote.objects.filter(created_at__lt=cutoff).order_by("pk")
+    if dry_run:
+        return candidates.count()
+    moved = 0
+    while True:
+        notes = list(candidates.select_related("contact")[:batch_size])
+        if not notes:
+            return moved
+        with transaction.atomic():
+            models.ArchivedCrmNote.objects.bulk_create([
+                models.ArchivedCrmNote(
+                    id=n.pk, contact=n.contact_id, contact_name=n.contact.name, note=n.note, created_at=n.created_at,
+                )
+                for n in notes
+            ])
+            models.CrmNote.objects.filter(pk__in=[n.pk for n in notes]).delete()
+        moved += len(notes)
@@ -0,0 +1,114 @@
+"""
+Field-level audit history for ProductVariant.price_cents,
+InventoryByLocation.on_hand and Order.status.
+
+Nothing is written synchronously with the change itself:
+
+- Model saves are diffed in post_save against the values remembered at
+  load, save and refresh (models.TracksLoadedValues), so no extra SELECT
+  is needed.
+- Bulk paths (stock transfers/counts, batch ingestion) already know old
+  and new values and call record().
+- Entries made inside a transaction go through transaction.on_commit, so
+  Django drops them if it (or the savepoint they were made in) rolls back.
+- Within a request, everything is written by AuditMiddleware with one
+  bulk_create once the response is ready. Outside a request, each
+  record() call is one INSERT after commit.
+"""
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from . import models
+
+Field = models.AuditEntry.Field
+
+# model -> {attname: AuditEntry.Field}
+AUDITED = {
+    models.ProductVariant: {"price_cents": Field.VARIANT_PRICE},
+    models.InventoryByLocation: {"on_hand": Field.INVENTORY_ON_HAND},
+    models.Order: {"status": Field.ORDER_STATUS},
+}
+
+_request_batch = ContextVar("audit_request_batch", default=None)  # [entries] while inside a request
+_source = ContextVar("audit_source", default="")
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _write(entries, request=None):
+    if not entries:
+        return
+    user = getattr(request, "user", None)  # resolved only when there is something to attribute
+    if user is not None and user.is_authenticated:
+        for entry in entries:
+            entry.actor_id = user.pk
+    models.AuditEntry.objects.bulk_create(entries, batch_size=2000)
+
+
+def _committed(entries):
+    pending = _request_batch.get()
+    if pending is not None:
+        pending.extend(entries)  # written once at the end of the request
+    else:
+        _write(entries)
+
+
+def record(field, changes, source=None):
+    """
+    Queue entries for (object_id, old, new) triples of one AuditEntry.Field;
+    unchanged values are skipped. They are written after the current
+    transaction commits (immediately when not in one).
+    """
+    now = timezone.now()
+    source = source if source is not None else _source.get()
+    entries = [
+        models.AuditEntry(field=field, object_id=pk, old_value=_text(old), new_value=_text(new),
+                          source=source, changed_at=now)
+        for pk, old, new in changes if old != new
+    ]
+    if entries:
+        # runs at once outside a transaction; robust: the change itself is already committed,
+        # so a failed audit write is logged rather than raised at the caller
+        transaction.on_commit(partial(_committed, entries), robust=True)
+
+
+def _on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    loaded = getattr(instance, "_loaded_values", None)
+    if raw or created or loaded is None:
+        return
+    for attname, field in AUDITED[sender].items():
+        if attname not in loaded or (update_fields is not None and attname not in update_fields):
+            continue
+        new = instance.__dict__.get(attname)
+        if new != loaded[attname]:
+            record(field, [(instance.pk, loaded[attname], new)])
+
+
+def connect_signals():
+    for model in AUDITED:
+        post_save.connect(_on_save, sender=model, dispatch_uid=f"audit-save-{model.__name__}")
+
+
+class AuditMiddleware:
+    """Collects the request's audit entries and writes them with one INSERT, attributed to request.user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        entries = []
+        token = _request_batch.set(entries)
+        source_token = _source.set("admin" if request.path.startswith("/admin/") else "api")
+        try:
+            response = self.get_response(request)
+        finally:
+            _source.reset(source_token)
+            _request_batch.reset(token)
+            _write(entries, request)
+        return response
@@ -0,0 +1,110 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Brotli is used when the client accepts it and the `brotli` package is
+installed (it comes with whitenoise[brotli]), gzip otherwise, honouring
+q-values. Responses smaller than COMPRESSION_MIN_SIZE, responses that are
+already encoded, file downloads (which keep Range support) and media types
+that are compressed already pass through untouched. HTML (admin, browsable
+API) is never compressed: it carries CSRF tokens next to reflected input,
+which is what BREACH needs, while API data formats carry no such secret.
+Static files never get here: WhiteNoise serves its own pre-compressed copies.
+"""
+import re
+
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+_CODING = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+_PRECOMPRESSED = re.compile(r"^(image|video|audio)/|^application/(zip|gzip|x-brotli|pdf|octet-stream)")
+_HTML = re.compile(r"^(text/html|application/xhtml\+xml)")
+
+
+def _min_size():
+    return getattr(settings, "COMPRESSION_MIN_SIZE", 1024)
+
+
+def _brotli_quality():
+    # 11 is for build-time assets; 4-5 is about gzip's speed with smaller output
+    return getattr(settings, "COMPRESSION_BROTLI_QUALITY", 4)
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header value."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        m = _CODING.match(part)
+        if not m:
+            continue
+        try:
+            accepted[m.group(1).lower()] = float(m.group(2)) if m.group(2) else 1.0
+        except ValueError:
+            continue
+
+    def q(coding):
+        return accepted.get(coding, accepted.get("*", 0.0))
+
+    options = [c for c in (("br", "gzip") if brotli else ("gzip",)) if q(c) > 0]
+    return max(options, key=q) if options else None  # ties keep the first, i.e. br
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=_brotli_quality())
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.has_header("Content-Encoding")
+            or response.status_code == 206
+            or isinstance(response, FileResponse)
+            or _PRECOMPRESSED.match(response.get("Content-Type", ""))
+            or _HTML.match(response.get("Content-Type", ""))
+        ):
+            return response
+        if not response.streaming and len(response.content) < _min_size():
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == "br":
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            if encoding == "br":
+                compressed = brotli.compress(response.content, quality=_brotli_quality())
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # the representation changed, so a strong validator no longer applies
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,79 @@
+"""
+Primary/replica routing.
+
+Reads go to a replica only while `replica_reads` is active: the middleware
+turns it on for safe (GET/HEAD) requests, and reporting code can use it
+directly as a context manager. Everything else, including any read inside
+a transaction or after a write in the same request, uses "default".
+One replica is picked per request/block and used for all of its reads, so
+queries that depend on each other (a change feed and the rows it names, a
+count and its page) never see replicas at different lag.
+After a client writes, a short-lived cookie pins its following requests to
+the primary so it always reads its own writes.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = "db_pin"
+
+_replica = ContextVar("replica", default=None)  # alias reads go to in this scope, or None
+
+
+def _replicas():
+    return getattr(settings, "REPLICA_DATABASES", [])
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads in this block to one replica (no-op when none are configured)."""
+    alias = None
+    replicas = _replicas()
+    if enabled and replicas:
+        alias = _replica.get() or random.choice(replicas)  # a nested block stays on the outer replica
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # anything read after a write in the same request must see it
+        _replica.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        dbs = {DEFAULT_DB_ALIAS, *_replicas()}
+        if obj1._state.db in dbs and obj2._state.db in dbs:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # left open so local SQLite stand-ins can be migrated with --database replica
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in ("GET", "HEAD") and STICKY_COOKIE not in request.COOKIES
+        with replica_reads(safe):
+            response = self.get_response(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE, "1", max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
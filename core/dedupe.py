@@ -0,0 +1,196 @@
+"""
+Contact de-duplication.
+
+Candidates are only compared inside blocks that share a cheap key
+(normalized phone, normalized email, phonetic name, email domain + phonetic
+name and, in batch scans, each name's rarest trigrams, which catch typos the
+phonetic key misses), so the work grows with block sizes rather than n².
+Blocks too generic to be useful are skipped and logged. Pairs are then
+scored with name trigram similarity plus phonetic-key and phone/email
+evidence; a shared phone with a matching phonetic key, or an identical
+name, is enough to be flagged even when there is no email to compare.
+"""
+import logging
+import re
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db import models as dj_models, transaction
+
+from . import models
+from .models import normalize_phone, phonetic_name_key
+
+log = logging.getLogger(__name__)
+
+# Blocks bigger than this are too generic to be useful ("J Smith" at gmail.com) and are skipped.
+MAX_BLOCK_SIZE = 200
+RARE_TRIGRAMS = 2  # trigram blocks per contact in find_duplicates
+DEFAULT_THRESHOLD = 0.75
+
+
+def _trigrams(name: str) -> frozenset:
+    s = f"  {re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).strip()} "
+    return frozenset(s[i:i + 3] for i in range(len(s) - 2))
+
+
+def _email_parts(email):
+    if not email or "@" not in email:
+        return "", ""
+    local, domain = email.lower().rsplit("@", 1)
+    local = local.split("+", 1)[0].replace(".", "")
+    return local, domain
+
+
+class _Row:
+    __slots__ = ("id", "name", "phone_key", "name_key", "local", "domain", "grams")
+
+    def __init__(self, pk, name, email, phone):
+        self.id = pk
+        self.name = name
+        self.phone_key = normalize_phone(phone)
+        self.name_key = phonetic_name_key(name)
+        self.local, self.domain = _email_parts(email)
+        self.grams = _trigrams(name)
+
+    def block_keys(self):
+        if self.phone_key:
+            yield "p:" + self.phone_key
+        if self.local and self.domain:
+            yield f"e:{self.local}@{self.domain}"
+        if self.name_key:
+            yield "n:" + self.name_key
+            if self.domain:
+                yield f"d:{self.domain}:{self.name_key}"
+
+
+def score(a: _Row, b: _Row) -> float:
+    """0..1 likelihood that two contact rows are the same person."""
+    union = a.grams | b.grams
+    name_sim = len(a.grams & b.grams) / len(union) if union else 0.0
+    s = 0.45 * name_sim
+    if a.name_key and a.name_key == b.name_key:
+        s += 0.3
+    if a.phone_key and a.phone_key == b.phone_key:
+        s += 0.4
+    if a.local and a.local == b.local and a.domain == b.domain:
+        s += 0.45
+    elif a.domain and a.domain == b.domain:
+        s += 0.05
+    return min(s, 1.0)
+
+
+def load_rows(queryset=None, refresh_keys=True, batch_size=2000):
+    """
+    Stream contacts into lightweight rows. With `refresh_keys`, stale
+    phone_key/name_key columns (e.g. from bulk imports that skipped save())
+    are written back with bulk_update.
+    """
+    qs = queryset if queryset is not None else models.Contact.objects.all()
+    qs = qs.only("id", "name", "email", "phone", "phone_key", "name_key").order_by()
+    rows, stale = [], []
+    for c in qs.iterator(chunk_size=batch_size):
+        row = _Row(c.id, c.name, c.email, c.phone)
+        rows.append(row)
+        if refresh_keys and (c.phone_key != row.phone_key or c.name_key != row.name_key):
+            c.phone_key, c.name_key = row.phone_key, row.name_key
+            stale.append(c)
+            if len(stale) >= batch_size:
+                models.Contact.objects.bulk_update(stale, ["phone_key", "name_key"])
+                stale = []
+    if stale:
+        models.Contact.objects.bulk_update(stale, ["phone_key", "name_key"])
+    return rows
+
+
+def find_duplicates(rows, threshold=DEFAULT_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """
+    Yield (score, id_a, id_b) for candidate pairs at or above `threshold`,
+    id_a < id_b, each pair at most once.
+    """
+    rows = list(rows)
+    # trigram blocking on each name's rarest trigrams: common ones ("ith") would only make huge blocks
+    frequency = Counter(g for row in rows for g in row.grams)
+    blocks = defaultdict(list)
+    for row in rows:
+        for key in row.block_keys():
+            blocks[key].append(row)
+        shared = sorted((g for g in row.grams if frequency[g] > 1), key=lambda g: (frequency[g], g))
+        for g in shared[:RARE_TRIGRAMS]:
+            blocks["g:" + g].append(row)
+
+    seen = set()
+    for key, members in blocks.items():
+        if len(members) > max_block_size:
+            log.warning("dedupe: skipping block %r with %d contacts (max %d)", key, len(members), max_block_size)
+            continue
+        if len(members) < 2:
+            continue
+        for a, b in combinations(members, 2):
+            pair = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+            if pair in seen:
+                continue
+            seen.add(pair)
+            s = score(a, b)
+            if s >= threshold:
+                yield round(s, 3), pair[0], pair[1]
+
+
+def duplicates_of(contact, threshold=DEFAULT_THRESHOLD):
+    """Candidates for a single contact, found through the indexed blocking keys."""
+    probe = _Row(contact.id, contact.name, contact.email, contact.phone)
+    q = dj_models.Q(pk__in=[])
+    if probe.phone_key:
+        q |= dj_models.Q(phone_key=probe.phone_key)
+    if probe.name_key:
+        q |= dj_models.Q(name_key=probe.name_key)
+    candidates = list(models.Contact.objects.filter(q).exclude(pk=contact.pk).order_by("pk")[:MAX_BLOCK_SIZE + 1])
+    if len(candidates) > MAX_BLOCK_SIZE:
+        log.warning("dedupe: contact %s has more than %d candidates; only the oldest are scored", contact.pk, MAX_BLOCK_SIZE)
+        candidates = candidates[:MAX_BLOCK_SIZE]
+    out = []
+    for c in candidates:
+        s = score(probe, _Row(c.id, c.name, c.email, c.phone))
+        if s >= threshold:
+            out.append((round(s, 3), c))
+    out.sort(key=lambda t: (-t[0], t[1].pk))
+    return out
+
+
+def _contact_foreign_keys():
+    """Every ForeignKey pointing at Contact (Order, CrmNote, CoaCertificate, Consignment, ...)."""
+    return [
+        rel for rel in models.Contact._meta.related_objects
+        if rel.one_to_many and rel.field.concrete
+    ]
+
+
+# archive tables keep the contact as a plain id column (core.archive), invisible to _contact_foreign_keys
+ARCHIVED_CONTACT_COLUMNS = ((models.ArchivedOrder, "buyer_contact"), (models.ArchivedCrmNote, "contact"))
+
+
+@transaction.atomic
+def merge_contacts(keep, duplicates):
+    """
+    Fold `duplicates` into `keep`: repoint every FK (and archived contact id)
+    with one UPDATE per relation, fill keep's blank fields from the
+    duplicates, then delete them.
+    """
+    dup_ids = [d.pk for d in duplicates if d.pk != keep.pk]
+    if not dup_ids:
+        return keep
+    for rel in _contact_foreign_keys():
+        rel.related_model._base_manager.filter(**{f"{rel.field.name}__in": dup_ids}).update(**{rel.field.name: keep.pk})
+    for model, column in ARCHIVED_CONTACT_COLUMNS:
+        model.objects.filter(**{f"{column}__in": dup_ids}).update(**{column: keep.pk})
+
+    dups = list(models.Contact.objects.filter(pk__in=dup_ids).order_by("pk"))
+    for field in ("email", "phone"):
+        if not getattr(keep, field):
+            setattr(keep, field, next((getattr(d, field) for d in dups if getattr(d, field)), None))
+    notes = [n for n in [keep.notes, *(d.notes for d in dups)] if n]
+    keep.notes = "\n\n".join(notes) or None
+
+    # delete first so a moved email doesn't trip the unique constraint
+    models.Contact.objects.filter(pk__in=dup_ids).delete()
+    keep.save()
+    return keep
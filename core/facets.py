@@ -0,0 +1,103 @@
+"""
+Facet counts for the product catalog (?facets=product_type,series,artist).
+
+Every requested facet is counted in one round trip: a UNION ALL of one
+GROUP BY per facet. Each facet honours all active filters except its own,
+so with ?product_type=original the product_type facet still shows how many
+products the other types would give. Results are cached per normalized
+filter state. The key includes the latest sync change id (one MAX over the
+primary key per request), so any recorded change to products, variants or
+inventory moves every worker on to fresh counts without explicit
+invalidation. Writes that skip core.sync are seen once FACET_CACHE_SECONDS
+pass. The cache is only shared between workers when REDIS_URL is set (see
+config/settings.py).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, Max, Q, Value, When
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+
+from . import models
+from .filters import available_expr
+
+_TRUE, _FALSE = Value("true"), Value("false")
+
+
+def _flag(condition):
+    return Case(When(condition, then=_TRUE), default=_FALSE, output_field=CharField())
+
+
+# facet name -> expression grouped on (as text, so all branches of the UNION line up)
+FACETS = {
+    "product_type": lambda: F("product_type"),
+    "series": lambda: F("series"),
+    "artist": lambda: F("artist"),
+    "is_active": lambda: _flag(Q(is_active=True)),
+    "available": lambda: _flag(available_expr()),
+}
+BOOLEAN_FACETS = {"is_active", "available"}
+
+# query params that change which products match (everything else - paging, fields, format - doesn't)
+_IGNORED_PARAMS = {"facets", "page", "page_size", "ordering", "fields", "expand", "format"}
+
+
+def requested(request):
+    raw = request.query_params.get("facets")
+    if not raw:
+        return []
+    names = list(dict.fromkeys(n.strip() for n in raw.split(",") if n.strip()))
+    unknown = [n for n in names if n not in FACETS]
+    if unknown:
+        raise ValidationError({"facets": f"unknown facet(s) {', '.join(unknown)}; choose from {', '.join(FACETS)}"})
+    return names
+
+
+def _catalog_version():
+    return models.SyncChange.objects.aggregate(v=Max("id"))["v"] or 0
+
+
+def _cache_key(request, names):
+    params = request.query_params
+    state = sorted((k, sorted(params.getlist(k))) for k in params if k not in _IGNORED_PARAMS)
+    digest = hashlib.sha1(repr((names, state)).encode()).hexdigest()
+    return f"facets:{_catalog_version()}:{digest}"
+
+
+def _filtered(view, request, exclude):
+    queryset = SearchFilter().filter_queryset(request, view.get_queryset(), view)
+    params = request.query_params.copy()
+    params.pop(exclude, None)
+    return view.filterset_class(params, queryset=queryset, request=request).qs
+
+
+def _count(view, request, names):
+    branches = [
+        _filtered(view, request, name).order_by()
+        .values(facet=Value(name, output_field=CharField()), value=FACETS[name]())
+        .annotate(n=Count("pk"))
+        for name in names
+    ]
+    query = branches[0].union(*branches[1:], all=True) if len(branches) > 1 else branches[0]
+
+    out = {name: [] for name in names}
+    for row in query:
+        value = row["value"]
+        if row["facet"] in BOOLEAN_FACETS:
+            value = value == "true"
+        out[row["facet"]].append({"value": value, "count": row["n"]})
+    for counts in out.values():
+        counts.sort(key=lambda c: (-c["count"], str(c["value"])))
+    return out
+
+
+def counts(view, request, names):
+    """{facet: [{"value", "count"}, ...]} for `names` (see requested()) under the request's filters."""
+    key = _cache_key(request, names)
+    result = cache.get(key)
+    if result is None:
+        result = _count(view, request, names)
+        cache.set(key, result, getattr(settings, "FACET_CACHE_SECONDS", 300))
+    return result
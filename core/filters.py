@@ -0,0 +1,24 @@
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework as filters
+
+from . import models
+
+
+def available_expr():
+    """True for products with stock on hand at a sellable location."""
+    return Exists(
+        models.InventoryByLocation.objects.filter(
+            variant__product=OuterRef("pk"), on_hand__gt=0, location__is_sellable=True,
+        )
+    )
+
+
+class ProductFilter(filters.FilterSet):
+    available = filters.BooleanFilter(method="filter_available")
+
+    class Meta:
+        model = models.Product
+        fields = ["product_type", "is_active", "series", "artist"]
+
+    def filter_available(self, queryset, name, value):
+        return queryset.filter(available_expr() if value else ~available_expr())
@@ -0,0 +1,190 @@
+"""
+Batch ingestion of offline in-person sales.
+
+Orders carry a client-generated `client_key`; keys already in the database
+are reported as duplicates and skipped, so a retried upload is harmless.
+Each chunk of orders is written in one transaction: bulk inserts for orders,
+items and payments, and one set-based UPDATE each for stock at the selling
+location and ProductVariant.edition_sold. Only sold (paid/fulfilled) orders
+take stock; variants sold at a location with no inventory row there are
+reported back as `missing_inventory` rather than skipped silently, and sales
+beyond what the location had on hand as `oversold`, per order. These sales
+already happened, so they are recorded either way; on_hand can't go below
+zero and stops there.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import audit, models, sync, tax
+
+CHUNK_SIZE = 500
+# statuses whose items leave stock; pending/cancelled/refunded uploads are recorded only
+STOCK_STATUSES = (models.Order.Status.PAID, models.Order.Status.FULFILLED)
+
+
+def _check_references(orders):
+    variant_ids = {i["variant"] for o in orders for i in o["items"]}
+    contact_ids = {o["buyer_contact"] for o in orders if o.get("buyer_contact")}
+    missing = {}
+    unknown = variant_ids - set(models.ProductVariant.objects.filter(pk__in=variant_ids).values_list("pk", flat=True))
+    if unknown:
+        missing["variants"] = sorted(unknown)
+    unknown = contact_ids - set(models.Contact.objects.filter(pk__in=contact_ids).values_list("pk", flat=True))
+    if unknown:
+        missing["buyer_contacts"] = sorted(unknown)
+    if missing:
+        raise ValidationError({"unknown_ids": missing})
+
+
+def _fill_tax(orders, now):
+    """Compute tax_cents (core.tax) for orders uploaded without one; one variant query per chunk."""
+    pending = [o for o in orders if o.get("tax_cents") is None]
+    if not pending:
+        return
+    info = tax.variant_info(i["variant"] for o in pending for i in o["items"])
+    table = tax.rates()
+    for o in pending:
+        _, o["tax_cents"] = tax.order_tax(
+            table, o.get("tax_jurisdiction", ""), timezone.localdate(o.get("created_at") or now),
+            [(*info[i["variant"]], i["qty"], i["unit_price_cents"]) for i in o["items"]],
+        )
+
+
+def _build_order(data, now):
+    subtotal = data.get("subtotal_cents")
+    if subtotal is None:
+        subtotal = sum(i["qty"] * i["unit_price_cents"] for i in data["items"])
+    total = data.get("total_cents")
+    if total is None:
+        total = subtotal + data["tax_cents"] + data["shipping_cents"]
+    created_at = data.get("created_at") or now
+    paid_at = data.get("paid_at")
+    if paid_at is None and data["status"] in (models.Order.Status.PAID, models.Order.Status.FULFILLED):
+        paid_at = created_at
+    return models.Order(
+        client_key=data["client_key"],
+        channel=data["channel"],
+        status=data["status"],
+        buyer_contact_id=data.get("buyer_contact"),
+        subtotal_cents=subtotal,
+        tax_cents=data["tax_cents"],
+        shipping_cents=data["shipping_cents"],
+        total_cents=total,
+        created_at=created_at,
+        paid_at=paid_at,
+        tax_jurisdiction=data.get("tax_jurisdiction", ""),
+    )
+
+
+def _apply_stock(location, lines):
+    """
+    Take the (client_key, variant_id, qty) sale `lines` out of on_hand at
+    `location` (floored at 0) and bump edition_sold, one UPDATE each.
+    Returns the variant ids that have no inventory row there, and the
+    oversold lines as {"client_key", "variant", "short"} in upload order.
+    """
+    if not lines:
+        return set(), []
+    sold = Counter()
+    for _, variant_id, qty in lines:
+        sold[variant_id] += qty
+    variant_ids = list(sold)
+    inventory = models.InventoryByLocation.objects.filter(location=location, variant_id__in=variant_ids)
+    # locked so the floored results recorded for the audit trail are what the UPDATE writes
+    before = list(inventory.select_for_update().values_list("pk", "variant_id", "on_hand"))
+
+    left = {variant_id: on_hand for _, variant_id, on_hand in before}
+    oversold = []
+    for client_key, variant_id, qty in lines:
+        if variant_id not in left:
+            continue  # reported as missing inventory
+        short = qty - max(left[variant_id], 0)
+        if short > 0:
+            oversold.append({"client_key": client_key, "variant": variant_id, "short": short})
+        left[variant_id] -= qty
+    inventory.update(on_hand=Greatest(
+        Case(
+            *[When(variant_id=v, then=F("on_hand") - Value(q)) for v, q in sold.items()],
+            default=F("on_hand"), output_field=IntegerField(),
+        ),
+        Value(0),
+        output_field=IntegerField(),
+    ))
+    models.ProductVariant.objects.filter(pk__in=variant_ids).update(edition_sold=Case(
+        *[When(pk=v, then=F("edition_sold") + Value(q)) for v, q in sold.items()],
+        default=F("edition_sold"), output_field=IntegerField(),
+    ))
+    sync.record(models.InventoryByLocation, [pk for pk, _, _ in before])
+    audit.record(audit.Field.INVENTORY_ON_HAND, [
+        (pk, on_hand, max(on_hand - sold[v], 0)) for pk, v, on_hand in before
+    ], source="ingest")
+    sync.record(models.ProductVariant, variant_ids)
+    return set(variant_ids) - set(left), oversold
+
+
+def _write_chunk(location, chunk, now):
+    """
+    Insert one chunk in its own transaction; returns (created, duplicates) as
+    {client_key: order_id}, the variant ids missing inventory at `location`
+    and the oversold lines (see _apply_stock).
+    """
+    keys = [o["client_key"] for o in chunk]
+    # durable: each chunk really commits (so a failed retry keeps the earlier ones) and the
+    # IntegrityError retry below re-reads committed keys instead of running in a poisoned outer block
+    with transaction.atomic(durable=True):
+        existing = dict(models.Order.objects.filter(client_key__in=keys).values_list("client_key", "pk"))
+        existing.update(models.ArchivedOrder.objects.filter(client_key__in=keys).values_list("client_key", "pk"))
+        fresh = [o for o in chunk if o["client_key"] not in existing]
+        _fill_tax(fresh, now)
+        orders = models.Order.objects.bulk_create([_build_order(o, now) for o in fresh])
+
+        items, payments, sold = [], [], []
+        for order, data in zip(orders, fresh):
+            for i in data["items"]:
+                items.append(models.OrderItem(
+                    order=order, variant_id=i["variant"], qty=i["qty"], unit_price_cents=i["unit_price_cents"],
+                ))
+                if data["status"] in STOCK_STATUSES:
+                    sold.append((order.client_key, i["variant"], i["qty"]))
+            for p in data["payments"]:
+                payments.append(models.Payment(
+                    order=order, method=p["method"], amount_cents=p["amount_cents"],
+                    received_at=p.get("received_at") or order.paid_at or order.created_at,
+                ))
+        models.OrderItem.objects.bulk_create(items, batch_size=2000)
+        models.Payment.objects.bulk_create(payments, batch_size=2000)
+        missing, oversold = _apply_stock(location, sold)
+    return {o.client_key: o.pk for o in orders}, existing, missing, oversold
+
+
+def ingest_orders(location, orders, chunk_size=CHUNK_SIZE):
+    """
+    Write validated batch orders (see serializers.OrderBatchSerializer).
+    Chunks that commit stay committed; a retry of the whole batch skips them.
+    Must not run inside a transaction (each chunk is its own; see _write_chunk).
+    """
+    _check_references(orders)
+    now = timezone.now()
+    created, duplicates, missing, oversold = {}, {}, set(), []
+    for start in range(0, len(orders), chunk_size):
+        chunk = orders[start:start + chunk_size]
+        try:
+            new, dup, unstocked, short = _write_chunk(location, chunk, now)
+        except IntegrityError:
+            # a concurrent upload inserted some of these keys first; re-read and retry once
+            new, dup, unstocked, short = _write_chunk(location, chunk, now)
+        created.update(new)
+        duplicates.update(dup)
+        missing |= unstocked
+        oversold += short
+    return {
+        "created": [{"client_key": k, "id": v} for k, v in created.items()],
+        "duplicates": [{"client_key": k, "id": v} for k, v in duplicates.items()],
+        "missing_inventory": sorted(missing),
+        "oversold": oversold,
+    }
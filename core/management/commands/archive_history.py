@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = "Move closed orders (with items/payments) and CRM notes older than N years into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=float, default=3)
+        parser.add_argument("--notes-years", type=float, help="age for CRM notes (defaults to --years)")
+        parser.add_argument("--batch", type=int, default=archive.DEFAULT_BATCH)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        verb = "would move" if opts["dry_run"] else "moved"
+        orders = archive.archive_orders(archive.cutoff_for(opts["years"]), opts["batch"], opts["dry_run"])
+        self.stdout.write(f"orders: {verb} {orders}")
+        notes_years = opts["notes_years"] if opts["notes_years"] is not None else opts["years"]
+        notes = archive.archive_crm_notes(archive.cutoff_for(notes_years), opts["batch"], opts["dry_run"])
+        self.stdout.write(f"crm notes: {verb} {notes}")
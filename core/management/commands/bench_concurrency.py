@@ -0,0 +1,63 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Open N concurrent slow clients against a running server and report how many it "
+        "serves at once. Run against a sync worker (gunicorn -w 1) and an async one "
+        "(GUNICORN_ASGI=1 gunicorn -w 1) using /api/products/ vs /api/async/products/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="e.g. http://127.0.0.1:8000/api/async/products/")
+        parser.add_argument("--clients", type=int, default=50)
+        parser.add_argument("--slow", type=float, default=0.5, help="seconds each client takes to send its request")
+        parser.add_argument("--timeout", type=float, default=60)
+
+    def handle(self, *args, **opts):
+        results = asyncio.run(self._run(opts["url"], opts["clients"], opts["slow"], opts["timeout"]))
+        wall, latencies, errors = results
+        self.stdout.write(f"{opts['clients']} clients, {opts['slow']}s to send each request")
+        self.stdout.write(f"completed {len(latencies)}, errors {errors}, wall {wall:.2f}s")
+        if latencies:
+            latencies.sort()
+            self.stdout.write(
+                f"latency p50 {statistics.median(latencies):.2f}s  p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}s"
+            )
+            # average number of requests in flight; ~clients if the worker interleaves them, ~1 if it serializes
+            self.stdout.write(f"effective concurrency {sum(latencies) / wall:.1f}")
+
+    async def _run(self, url, clients, slow, timeout):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        async def one():
+            t0 = time.perf_counter()
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                writer.write(f"GET {target} HTTP/1.1\r\n".encode())
+                await writer.drain()
+                await asyncio.sleep(slow)  # a slow client trickling its headers
+                writer.write(f"Host: {host}\r\nConnection: close\r\n\r\n".encode())
+                await writer.drain()
+                status = (await reader.readline()).split()
+                await reader.read()
+                if len(status) < 2 or status[1] != b"200":
+                    raise RuntimeError(status)
+            finally:
+                writer.close()
+            return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(one(), timeout) for _ in range(clients)), return_exceptions=True
+        )
+        wall = time.perf_counter() - t0
+        latencies = [o for o in outcomes if isinstance(o, float)]
+        return wall, latencies, len(outcomes) - len(latencies)
@@ -0,0 +1,81 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+# env overrides read by config/settings.py for each mode
+MODES = {
+    "fresh": {"DB_POOL": "0", "DB_CONN_MAX_AGE": "0"},
+    "persistent": {"DB_POOL": "0", "DB_CONN_MAX_AGE": "600"},
+    "pool": {"DB_POOL": "1"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request DB latency with a fresh connection per request, "
+        "persistent connections (CONN_MAX_AGE) and the psycopg pool, under concurrent load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=200, help="requests per thread")
+        parser.add_argument("--modes", default=",".join(MODES))
+        parser.add_argument("--worker", action="store_true", help="internal: run one measurement in this process")
+
+    def handle(self, *args, **opts):
+        if opts["worker"]:
+            self.stdout.write(json.dumps(self._work(opts["threads"], opts["requests"])))
+            return
+
+        self.stdout.write(f"{opts['threads']} threads x {opts['requests']} requests, one query per request")
+        self.stdout.write(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for mode in opts["modes"].split(","):
+            env = {**os.environ, **MODES[mode], "GUNICORN_THREADS": str(opts["threads"])}
+            out = subprocess.run(
+                [sys.executable, "manage.py", "bench_db", "--worker",
+                 "--threads", str(opts["threads"]), "--requests", str(opts["requests"])],
+                capture_output=True, text=True, env=env, check=True, cwd=settings.BASE_DIR,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            self.stdout.write(f"{mode:<12}{r['rps']:>10.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}")
+
+    def _work(self, threads, requests):
+        latencies = []
+        lock = threading.Lock()
+
+        def run():
+            mine = []
+            for _ in range(requests):
+                t0 = time.perf_counter()
+                # same connection lifecycle hooks Django runs around a real request
+                request_started.send(sender=self.__class__)
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                request_finished.send(sender=self.__class__)
+                mine.append(time.perf_counter() - t0)
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+
+        t0 = time.perf_counter()
+        pool = [threading.Thread(target=run) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        latencies.sort()
+        return {
+            "rps": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        }
@@ -0,0 +1,63 @@
+import gzip
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from core import compression
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch one large API page in each response format (JSON, MessagePack; identity, gzip, brotli) "
+        "and report payload size, server time, client decode time and estimated transfer time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="/api/inventory/")
+        parser.add_argument("--page-size", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--mbps", type=float, default=50, help="link speed used for the transfer estimate")
+        parser.add_argument("--host", default="localhost", help="must be in ALLOWED_HOSTS")
+
+    def handle(self, *args, **opts):
+        client = Client(SERVER_NAME=opts["host"])
+        formats = [
+            ("json", "application/json", json.loads),
+            ("msgpack", "application/msgpack", lambda b: msgpack.unpackb(b, raw=False)),
+        ]
+        encodings = ["identity", "gzip"] + (["br"] if compression.brotli else [])
+
+        self.stdout.write(f"GET {opts['path']}?page_size={opts['page_size']}, best of {opts['repeat']}, {opts['mbps']:g} Mbit/s link")
+        self.stdout.write(
+            f"{'format':<18}{'bytes':>12}{'server ms':>12}{'decode ms':>12}{'transfer ms':>13}{'total ms':>11}"
+        )
+        for name, media_type, loads in formats:
+            for encoding in encodings:
+                server, decode, size = [], [], None
+                for _ in range(opts["repeat"]):
+                    t0 = time.perf_counter()
+                    response = client.get(
+                        opts["path"], {"page_size": opts["page_size"]},
+                        HTTP_ACCEPT=media_type, HTTP_ACCEPT_ENCODING=encoding,
+                    )
+                    server.append(time.perf_counter() - t0)
+                    if response.status_code != 200:
+                        self.stderr.write(f"{name}/{encoding}: HTTP {response.status_code}")
+                        return
+                    body = response.content
+                    size = len(body)
+                    t0 = time.perf_counter()
+                    used = response.get("Content-Encoding", "identity")
+                    if used == "gzip":
+                        body = gzip.decompress(body)
+                    elif used == "br":
+                        body = compression.brotli.decompress(body)
+                    loads(body)
+                    decode.append(time.perf_counter() - t0)
+                s, d = min(server) * 1000, min(decode) * 1000
+                transfer = size * 8 / (opts["mbps"] * 1e6) * 1000
+                label = name if used == "identity" else f"{name}+{used}"
+                self.stdout.write(f"{label:<18}{size:>12}{s:>12.1f}{d:>12.1f}{transfer:>13.1f}{s + d + transfer:>11.1f}")
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from core import models, phash
+
+
+class Command(BaseCommand):
+    help = (
+        "Fingerprint every Media image (in parallel worker processes) and print clusters "
+        "of perceptual duplicates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=int, default=phash.DEFAULT_THRESHOLD, help="max pHash distance in bits")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--refresh", action="store_true", help="recompute all fingerprints, not just missing/stale ones")
+
+    def handle(self, *args, **opts):
+        if opts["refresh"]:
+            todo = list(models.Media.objects.exclude(image="").exclude(image__isnull=True))
+        else:
+            todo = phash.stale_media()
+        self.stdout.write(f"fingerprinting {len(todo)} image(s) with {opts['workers']} worker(s)")
+        if todo:
+            self._fingerprint(todo, opts["workers"])
+
+        groups = phash.clusters(opts["threshold"])
+        media = models.Media.objects.select_related("product").in_bulk([pk for g in groups for pk in g])
+        self.stdout.write(f"{len(groups)} cluster(s) within {opts['threshold']} bits")
+        for n, group in enumerate(groups, 1):
+            self.stdout.write(f"cluster {n}:")
+            for pk in group:
+                m = media[pk]
+                self.stdout.write(f"\t{pk}\t{m.product.title}\t{m.kind}\t{m.image.name}")
+
+    def _fingerprint(self, todo, workers):
+        paths = [phash._media_path(m) for m in todo]
+        # decoding is the expensive part, so only file paths cross the process boundary;
+        # initializer=django.setup keeps this working under the spawn start method too
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            results = list(pool.map(_hash_or_none, paths, chunksize=8))
+
+        rows = []
+        for media, hashes in zip(todo, results):
+            if hashes is None:
+                self.stderr.write(f"skipped media {media.pk}: cannot read {media.image.name}")
+                continue
+            a, d, p = (phash.to_signed(h) for h in hashes)
+            rows.append(models.MediaFingerprint(media=media, image_name=media.image.name, ahash=a, dhash=d, phash=p))
+        models.MediaFingerprint.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True, unique_fields=["media"],
+            update_fields=["image_name", "ahash", "dhash", "phash", "updated_at"],
+        )
+
+
+def _hash_or_none(path):
+    if path is None:
+        return None
+    try:
+        return phash.hashes(path)
+    except phash.UNREADABLE:
+        return None
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the delta-sync feed: below the horizon keep only each row's latest entry and drop tombstones. "
+        "Clients holding an older token get 410 and resync from 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=sync.DEFAULT_RETENTION.days,
+                            help="keep every entry recorded in the last N days")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        stats = sync.compact(timedelta(days=opts["days"]), opts["dry_run"])
+        verb = "would remove" if opts["dry_run"] else "removed"
+        self.stdout.write(
+            f"horizon: {stats['horizon']}, {verb} {stats['superseded']} superseded entries "
+            f"and {stats['tombstones']} tombstones"
+        )
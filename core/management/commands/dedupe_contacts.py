@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from core import dedupe, models
+
+
+class Command(BaseCommand):
+    help = "Find likely duplicate contacts (blocking + similarity scoring) and optionally merge them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=float, default=dedupe.DEFAULT_THRESHOLD)
+        parser.add_argument("--max-block", type=int, default=dedupe.MAX_BLOCK_SIZE)
+        parser.add_argument("--merge", action="store_true", help="merge each cluster into its oldest contact")
+
+    def handle(self, *args, **opts):
+        rows = dedupe.load_rows()
+        pairs = list(dedupe.find_duplicates(rows, threshold=opts["threshold"], max_block_size=opts["max_block"]))
+        self.stdout.write(f"{len(rows)} contacts, {len(pairs)} candidate pairs")
+        for s, a, b in pairs:
+            self.stdout.write(f"{s:.3f}\t{a}\t{b}")
+        if not opts["merge"] or not pairs:
+            return
+
+        # union-find so chains (a~b, b~c) collapse into one cluster
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for _, a, b in pairs:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        clusters = {}
+        for x in list(parent):
+            clusters.setdefault(find(x), []).append(x)
+
+        contacts = models.Contact.objects.in_bulk(list(parent))
+        merged = 0
+        for keep_id, ids in clusters.items():
+            dups = [contacts[i] for i in ids if i != keep_id]
+            dedupe.merge_contacts(contacts[keep_id], dups)
+            merged += len(dups)
+        self.stdout.write(self.style.SUCCESS(f"merged {merged} contacts into {len(clusters)}"))
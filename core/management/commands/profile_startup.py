@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so we measure a real cold start, not this process.
+BOOT = """
+import json, os, sys, time
+t0 = time.perf_counter()
+def rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+def heavy():
+    return sorted(m for m in ("PIL", "rest_framework", "django_filters", "psycopg") if m in sys.modules)
+stages = [("interpreter", 0.0, rss_kb(), heavy())]
+import django
+django.setup()
+stages.append(("django.setup", time.perf_counter() - t0, rss_kb(), heavy()))
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+stages.append(("urlconf", time.perf_counter() - t0, rss_kb(), heavy()))
+print(json.dumps({"settings": os.environ.get("DJANGO_SETTINGS_MODULE"), "stages": stages}))
+if os.environ.get("PROFILE_TRACEMALLOC"):
+    import tracemalloc
+    snap = tracemalloc.take_snapshot()
+    print(json.dumps([[s.traceback[0].filename, s.size] for s in snap.statistics("filename")]))
+"""
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+class Command(BaseCommand):
+    help = "Report cold-start import time and memory per module (python -X importtime / tracemalloc)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument("--no-memory", action="store_true", help="skip the slower tracemalloc pass")
+
+    def _run(self, *flags, env=None):
+        # from the project root so `config` imports wherever the command was started
+        proc = subprocess.run(
+            [sys.executable, *flags, "-c", BOOT],
+            capture_output=True, text=True, env={**os.environ, **(env or {})}, cwd=settings.BASE_DIR,
+        )
+        if proc.returncode:
+            errors = [line for line in proc.stderr.splitlines() if not IMPORTTIME.match(line)]
+            raise CommandError("profiling run failed:\n" + "\n".join(errors[-30:]))
+        return proc
+
+    def handle(self, *args, **opts):
+        top = opts["top"]
+        proc = self._run("-X", "importtime")
+        summary = json.loads(proc.stdout.splitlines()[0])
+
+        self.stdout.write(f"settings: {summary['settings']}")
+        self.stdout.write("stage               seconds   RSS MiB  heavy packages loaded")
+        for name, secs, rss, heavy in summary["stages"]:
+            self.stdout.write(f"{name:<18} {secs:8.3f} {rss / 1024:9.1f}  {', '.join(heavy) or '-'}")
+
+        per_package = defaultdict(int)
+        cumulative = []
+        for line in proc.stderr.splitlines():
+            m = IMPORTTIME.match(line)
+            if not m:
+                continue
+            self_us, cum_us, module = int(m[1]), int(m[2]), m[3]
+            per_package[module.split(".")[0]] += self_us
+            cumulative.append((cum_us, module))
+
+        self.stdout.write(f"\nimport time by top-level package (self, ms) - top {top}")
+        for pkg, us in sorted(per_package.items(), key=lambda kv: -kv[1])[:top]:
+            self.stdout.write(f"{us / 1000:9.1f}  {pkg}")
+        self.stdout.write(f"\nslowest imports (cumulative, ms) - top {top}")
+        for us, module in sorted(cumulative, reverse=True)[:top]:
+            self.stdout.write(f"{us / 1000:9.1f}  {module}")
+
+        if opts["no_memory"]:
+            return
+        proc = self._run("-X", "tracemalloc=1", env={"PROFILE_TRACEMALLOC": "1"})
+        per_package = defaultdict(int)
+        for filename, size in json.loads(proc.stdout.splitlines()[1]):
+            per_package[self._package_of(filename)] += size
+        self.stdout.write(f"\nallocated memory by package (KiB) - top {top}")
+        for pkg, size in sorted(per_package.items(), key=lambda kv: -kv[1])[:top]:
+            self.stdout.write(f"{size / 1024:9.1f}  {pkg}")
+
+    @staticmethod
+    def _package_of(filename):
+        parts = filename.replace("\\", "/").split("/")
+        if "site-packages" in parts:
+            return parts[parts.index("site-packages") + 1].removesuffix(".py")
+        for root in ("config", "core"):
+            if root in parts:
+                return root
+        return "<stdlib>" if "lib" in parts else "<other>"
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete unfinished chunked Media uploads (and their partial files) that have been idle for N hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=uploads.DEFAULT_STALE.total_seconds() / 3600)
+
+    def handle(self, *args, **opts):
+        count = uploads.purge_stale(timedelta(hours=opts["hours"]))
+        self.stdout.write(f"purged {count} stale upload(s)")
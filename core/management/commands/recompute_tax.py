@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core import models, tax
+
+
+class Command(BaseCommand):
+    help = "Recompute tax_cents/total_cents of live orders from the current TaxRate table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="only orders created on/after this date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="only orders created before this date (YYYY-MM-DD)")
+        parser.add_argument("--status", action="append", help="only orders with this status (repeatable)")
+        parser.add_argument("--chunk", type=int, default=tax.DEFAULT_CHUNK)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        queryset = models.Order.objects.all()
+        for opt, lookup in (("since", "created_at__date__gte"), ("until", "created_at__date__lt")):
+            if opts[opt]:
+                day = parse_date(opts[opt])
+                if day is None:
+                    raise CommandError(f"--{opt}: expected YYYY-MM-DD")
+                queryset = queryset.filter(**{lookup: day})
+        if opts["status"]:
+            queryset = queryset.filter(status__in=opts["status"])
+
+        stats = tax.recompute(queryset, opts["chunk"], opts["dry_run"])
+        verb = "would change" if opts["dry_run"] else "changed"
+        self.stdout.write(
+            f"orders: {stats['orders']}, {verb}: {stats['changed']}, tax delta: {stats['tax_delta_cents']} cents"
+        )
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_rename_file_media_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='consignment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='core.consignment'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['consignment', 'created_at'], name='core_order_consign_7e1694_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_order_consignment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=10),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_existing_rows(apps, schema_editor):
+    """Log every existing row so ?since=0 is a complete initial sync."""
+    SyncChange = apps.get_model('core', 'SyncChange')
+    for key, model_name in [
+        ('products', 'Product'),
+        ('variants', 'ProductVariant'),
+        ('inventory', 'InventoryByLocation'),
+        ('media', 'Media'),
+    ]:
+        ids = apps.get_model('core', model_name).objects.order_by('pk').values_list('pk', flat=True)
+        SyncChange.objects.bulk_create(
+            (SyncChange(model=key, object_id=pk) for pk in ids.iterator()), batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_contact_blocking_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(seed_existing_rows, migrations.RunPython.noop),
+    ]
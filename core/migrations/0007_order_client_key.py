@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_sync_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='client_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_order_client_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCrmNote',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('contact', models.BigIntegerField(db_index=True)),
+                ('contact_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('note', models.TextField()),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('buyer_contact', models.BigIntegerField(blank=True, null=True)),
+                ('buyer_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('channel', models.CharField(choices=[('online', 'Online'), ('in_person', 'In Person'), ('consignment', 'Consignment')], max_length=20)),
+                ('consignment', models.BigIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled'), ('refunded', 'Refunded')], max_length=20)),
+                ('subtotal_cents', models.IntegerField(default=0)),
+                ('tax_cents', models.IntegerField(default=0)),
+                ('shipping_cents', models.IntegerField(default=0)),
+                ('total_cents', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('client_key', models.CharField(blank=True, max_length=64, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('variant', models.BigIntegerField()),
+                ('variant_label', models.CharField(blank=True, max_length=255, null=True)),
+                ('product_title', models.CharField(blank=True, max_length=255, null=True)),
+                ('qty', models.PositiveIntegerField()),
+                ('unit_price_cents', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('method', models.CharField(choices=[('card', 'Card'), ('cash', 'Cash'), ('check', 'Check'), ('stripe', 'Stripe'), ('paypal', 'PayPal')], max_length=20)),
+                ('amount_cents', models.PositiveIntegerField()),
+                ('received_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='core_order_status_273d1f_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core.archivedorder'),
+        ),
+        migrations.AddField(
+            model_name='archivedpayment',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='core.archivedorder'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_archive_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low_stock', 'Low Stock'), ('edition_sellout', 'Edition Near Sellout')], max_length=20)),
+                ('value', models.IntegerField()),
+                ('threshold', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.location')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='core.productvariant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('location__isnull', False), ('resolved_at__isnull', True)), fields=('kind', 'variant', 'location'), name='one_open_stock_alert_per_location'), models.UniqueConstraint(condition=models.Q(('location__isnull', True), ('resolved_at__isnull', True)), fields=('kind', 'variant'), name='one_open_stock_alert_per_variant')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockThreshold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('low_stock_at', models.PositiveIntegerField(blank=True, null=True)),
+                ('edition_remaining_at', models.PositiveIntegerField(blank=True, null=True)),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.location')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_thresholds', to='core.productvariant')),
+            ],
+            options={
+                'unique_together': {('variant', 'location')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_media_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFingerprint',
+            fields=[
+                ('media', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='core.media')),
+                ('image_name', models.CharField(max_length=255)),
+                ('ahash', models.BigIntegerField()),
+                ('dhash', models.BigIntegerField()),
+                ('phash', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_media_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.PositiveSmallIntegerField(choices=[(1, 'ProductVariant.price_cents'), (2, 'InventoryByLocation.on_hand'), (3, 'Order.status')])),
+                ('object_id', models.BigIntegerField()),
+                ('old_value', models.CharField(blank=True, max_length=20, null=True)),
+                ('new_value', models.CharField(blank=True, max_length=20, null=True)),
+                ('source', models.CharField(blank=True, max_length=16)),
+                ('changed_at', models.DateTimeField(db_index=True)),
+                ('actor', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['field', 'object_id', 'changed_at'], name='core_audite_field_37fdb4_idx')],
+            },
+        ),
+    ]
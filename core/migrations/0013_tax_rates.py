@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_audit_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='tax_jurisdiction',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax_jurisdiction',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='TaxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jurisdiction', models.CharField(max_length=20)),
+                ('product_type', models.CharField(blank=True, choices=[('original', 'Original'), ('limited_print', 'Limited Edition Print'), ('open_print', 'Open Edition Print'), ('merch', 'Merch')], default='', max_length=20)),
+                ('rate', models.DecimalField(decimal_places=5, max_digits=7)),
+                ('valid_from', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('jurisdiction', 'product_type', 'valid_from')},
+            },
+        ),
+    ]
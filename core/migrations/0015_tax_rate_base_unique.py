@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_archivedorder_client_key_unique'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='taxrate',
+            constraint=models.UniqueConstraint(condition=models.Q(('valid_from__isnull', True)), fields=('jurisdiction', 'product_type'), name='one_base_tax_rate'),
+        ),
+    ]
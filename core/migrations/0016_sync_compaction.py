@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_tax_rate_base_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCompaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizon', models.BigIntegerField()),
+                ('removed', models.PositiveIntegerField()),
+                ('ran_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='syncchange',
+            index=models.Index(fields=['model', 'object_id'], name='core_syncch_model_8bcb1d_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 ﻿
 
 # Create your models here.
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 import re
@@ -32,6 +34,83 @@ def unique_sku_for(model, base: str, max_len: int = SKU_MAX_LEN) -> str:
         i += 1
 
 
+def normalize_phone(phone) -> str:
+    """
+    Digits only, US country code dropped, last 10 digits kept ("" if too short to be useful).
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    digits = digits[-10:]
+    return digits if len(digits) >= 7 else ''
+
+_SOUNDEX = {c: str(d) for d, letters in enumerate(('aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r')) for c in letters}
+
+def soundex(word: str) -> str:
+    word = re.sub(r'[^a-z]', '', (word or '').lower())
+    if not word:
+        return ''
+    out, last = word[0].upper(), _SOUNDEX[word[0]]
+    for c in word[1:]:
+        code = _SOUNDEX[c]
+        if code != '0' and code != last:
+            out += code
+        if c not in 'hw':
+            last = code
+    return (out + '000')[:4]
+
+# common nicknames whose initial differs from the given name's ("Bob Brown" ~ "Robert Brown")
+_NICKNAMES = {
+    'bob': 'robert', 'bobby': 'robert', 'bill': 'william', 'billy': 'william', 'dick': 'richard',
+    'peggy': 'margaret', 'peg': 'margaret', 'betty': 'elizabeth', 'beth': 'elizabeth', 'liz': 'elizabeth',
+    'ted': 'edward', 'ned': 'edward', 'tony': 'anthony', 'polly': 'mary', 'molly': 'mary',
+    'jack': 'john', 'hank': 'henry', 'sandy': 'alexandra', 'chuck': 'charles',
+}
+
+def phonetic_name_key(name) -> str:
+    """
+    Soundex of the last name plus first initial, e.g. "Jon Smyth" -> "S530J".
+    Token order is ignored so "Smith, John" blocks with "John Smith", and
+    common nicknames use the given name's initial. Rows saved before a change
+    here are re-keyed by dedupe.load_rows().
+    """
+    tokens = re.findall(r'[a-z]+', (name or '').lower())
+    if not tokens:
+        return ''
+    if ',' in (name or ''):
+        tokens = tokens[1:] + tokens[:1]
+    first = _NICKNAMES.get(tokens[0], tokens[0]) if len(tokens) > 1 else tokens[0]
+    return soundex(tokens[-1]) + first[0].upper()
+
+
+class TracksLoadedValues:
+    """
+    Remembers the database values of `audited_fields` when a row is loaded,
+    saved or refreshed, so core.audit can diff them on save without an extra SELECT.
+    """
+    audited_fields = ()
+
+    def _remember(self, fields=None):
+        snapshot = self.__dict__.setdefault('_loaded_values', {})
+        for f in self.audited_fields:
+            if f in self.__dict__ and (fields is None or f in fields):
+                snapshot[f] = self.__dict__[f]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)  # post_save (core.audit) still sees the previous snapshot
+        self._remember(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember(fields)
+
+
 # ---------- Core Catalog ----------
 class Product(models.Model):
     class ProductType(models.TextChoices):
@@ -62,7 +141,9 @@ class Product(models.Model):
         super().save(*args, **kwargs)
 
 
-class ProductVariant(models.Model):
+class ProductVariant(TracksLoadedValues, models.Model):
+    audited_fields = ('price_cents',)
+
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
     option_label = models.CharField(max_length=255)  # e.g., "18x24 Hahnemühle"
     price_cents = models.PositiveIntegerField()
@@ -98,6 +179,44 @@ class Media(models.Model):
         return f"{self.product.title} — {self.kind}"
 
 
+class MediaUpload(models.Model):
+    """
+    A resumable chunked upload of a large scan (see core.uploads). Chunks are
+    appended to a partial file outside MEDIA_ROOT; `received` only advances
+    past a chunk once its checksum has been verified, so a client resumes at
+    uploads.next_chunk() (received in whole chunks, rounded up). On completion the file is moved into
+    Media.image (products/%Y/%m/) and `media` points at that row.
+    """
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='uploads')
+    kind = models.CharField(max_length=20, choices=Media.MediaKind.choices, default=Media.MediaKind.DETAIL)
+    alt_text = models.CharField(max_length=255, blank=True, null=True)
+    media = models.ForeignKey(Media, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # expected digest of the whole file
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class MediaFingerprint(models.Model):
+    """Perceptual hashes of a Media image (see core.phash), stored as signed 64-bit ints."""
+    media = models.OneToOneField(Media, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    image_name = models.CharField(max_length=255)  # Media.image these were computed from; a mismatch means stale
+    ahash = models.BigIntegerField()
+    dhash = models.BigIntegerField()
+    phash = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.media_id}: {self.phash & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
 # ---------- Contacts / CRM ----------
 class Contact(models.Model):
     class Kind(models.TextChoices):
@@ -112,10 +231,21 @@ class Contact(models.Model):
     email = models.EmailField(blank=True, null=True, unique=True)
     phone = models.CharField(max_length=50, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
+    # blocking keys for duplicate detection (see core.dedupe); kept in sync on save
+    phone_key = models.CharField(max_length=10, blank=True, default='', db_index=True, editable=False)
+    name_key = models.CharField(max_length=8, blank=True, default='', db_index=True, editable=False)
 
     def __str__(self):
         return f"{self.name} ({self.kind})"
 
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone(self.phone)
+        self.name_key = phonetic_name_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'phone_key', 'name_key'}
+        super().save(*args, **kwargs)
+
 
 class CrmNote(models.Model):
     contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='crm_notes', related_query_name='crm_note',)
@@ -132,7 +262,9 @@ class Location(models.Model):
         return self.name
 
 
-class InventoryByLocation(models.Model):
+class InventoryByLocation(TracksLoadedValues, models.Model):
+    audited_fields = ('on_hand',)
+
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='location_inventory')
     location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='inventory')
     on_hand = models.PositiveIntegerField(default=0)
@@ -142,7 +274,9 @@ class InventoryByLocation(models.Model):
 
 
 # ---------- Orders / Payments ----------
-class Order(models.Model):
+class Order(TracksLoadedValues, models.Model):
+    audited_fields = ('status',)
+
     class Channel(models.TextChoices):
         ONLINE = 'online', 'Online'
         IN_PERSON = 'in_person', 'In Person'
@@ -157,6 +291,8 @@ class Order(models.Model):
 
     buyer_contact = models.ForeignKey(Contact, on_delete=models.SET_NULL, null=True, blank=True)
     channel = models.CharField(max_length=20, choices=Channel.choices, default=Channel.ONLINE)
+    # set for channel=consignment sales so settlement knows which gallery sold it
+    consignment = models.ForeignKey('Consignment', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     subtotal_cents = models.IntegerField(default=0)
     tax_cents = models.IntegerField(default=0)
@@ -164,10 +300,24 @@ class Order(models.Model):
     total_cents = models.IntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
     paid_at = models.DateTimeField(blank=True, null=True)
+    # idempotency key generated by the POS; retried uploads with the same key are skipped
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    # e.g. 'US-CA-SF' (see TaxRate); blank = settings.TAX_DEFAULT_JURISDICTION
+    tax_jurisdiction = models.CharField(max_length=20, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['consignment', 'created_at']),
+            models.Index(fields=['status', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} ({self.status})"
 
+    def clean(self):
+        if self.consignment_id and self.channel != self.Channel.CONSIGNMENT:
+            raise ValidationError({'consignment': "Only consignment-channel orders can belong to a consignment."})
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -190,6 +340,34 @@ class Payment(models.Model):
     received_at = models.DateTimeField(default=timezone.now)
 
 
+class TaxRate(models.Model):
+    """
+    Local sales-tax table used by core.tax. Jurisdictions are hyphenated from
+    broad to narrow ('US', 'US-CA', 'US-CA-SF') and the rates of every level
+    add up. Within a level, a row for the product's type beats the blank
+    (all types) row, and the latest valid_from on or before the order date wins.
+    """
+    jurisdiction = models.CharField(max_length=20)
+    product_type = models.CharField(max_length=20, choices=Product.ProductType.choices, blank=True, default='')
+    rate = models.DecimalField(max_digits=7, decimal_places=5)  # 0.07250 = 7.25%
+    valid_from = models.DateField(blank=True, null=True)  # NULL = since forever
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('jurisdiction', 'product_type', 'valid_from')
+        constraints = [
+            # NULLs never collide in unique_together, so one "since forever" row needs its own index
+            models.UniqueConstraint(
+                fields=['jurisdiction', 'product_type'],
+                condition=models.Q(valid_from__isnull=True),
+                name='one_base_tax_rate',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.jurisdiction} {self.product_type or '*'} {self.rate}"
+
+
 # ---------- COAs ----------
 class CoaCertificate(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
@@ -222,3 +400,155 @@ class ConsignmentItem(models.Model):
 
    
 
+
+
+
+# ---------- Stock alerts ----------
+class StockThreshold(models.Model):
+    """
+    Alert levels for a variant, at one location or (location empty) at every
+    sellable location. low_stock_at: alert when on_hand <= this.
+    edition_remaining_at: alert when edition_size - edition_sold <= this
+    (variant-wide rows only; falls back to settings.EDITION_ALERT_REMAINING).
+    """
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='stock_thresholds')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, null=True, blank=True)
+    low_stock_at = models.PositiveIntegerField(blank=True, null=True)
+    edition_remaining_at = models.PositiveIntegerField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('variant', 'location')
+
+
+class StockAlert(models.Model):
+    class Kind(models.TextChoices):
+        LOW_STOCK = 'low_stock', 'Low Stock'
+        EDITION_SELLOUT = 'edition_sellout', 'Edition Near Sellout'
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='stock_alerts')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, null=True, blank=True)
+    value = models.IntegerField()  # on_hand, or editions remaining
+    threshold = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # at most one open alert per condition (two indexes because NULL locations never collide)
+            models.UniqueConstraint(
+                fields=['kind', 'variant', 'location'],
+                condition=models.Q(resolved_at__isnull=True, location__isnull=False),
+                name='one_open_stock_alert_per_location',
+            ),
+            models.UniqueConstraint(
+                fields=['kind', 'variant'],
+                condition=models.Q(resolved_at__isnull=True, location__isnull=True),
+                name='one_open_stock_alert_per_variant',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.variant} ({self.value})"
+
+
+# ---------- Audit ----------
+class AuditEntry(models.Model):
+    """
+    One field-level change (see core.audit). Written in batches after
+    commit; values are stored as short text so one table covers ints and
+    status codes.
+    """
+    class Field(models.IntegerChoices):
+        VARIANT_PRICE = 1, 'ProductVariant.price_cents'
+        INVENTORY_ON_HAND = 2, 'InventoryByLocation.on_hand'
+        ORDER_STATUS = 3, 'Order.status'
+
+    field = models.PositiveSmallIntegerField(choices=Field.choices)
+    object_id = models.BigIntegerField()
+    old_value = models.CharField(max_length=20, blank=True, null=True)
+    new_value = models.CharField(max_length=20, blank=True, null=True)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='+', db_index=False)
+    source = models.CharField(max_length=16, blank=True)  # 'api', 'admin', 'transfer', 'count', 'ingest', ...
+    changed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['field', 'object_id', 'changed_at'])]
+
+    def __str__(self):
+        return f"{self.get_field_display()} #{self.object_id}: {self.old_value} -> {self.new_value}"
+
+
+# ---------- Sync ----------
+class SyncChange(models.Model):
+    """
+    Change feed for POS/storefront delta sync (see core.sync). `id` is the
+    monotonically increasing sequence clients pass back as ?since=.
+    """
+    model = models.CharField(max_length=30)  # core.sync.SYNC_MODELS key, e.g. 'product'
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['model', 'object_id'])]  # "is there a later entry" in compaction
+
+
+class SyncCompaction(models.Model):
+    """
+    One row per `compact_sync` run. The latest `horizon` is the oldest ?since=
+    the feed still serves; older tokens must resync from 0.
+    """
+    horizon = models.BigIntegerField()
+    removed = models.PositiveIntegerField()
+    ran_at = models.DateTimeField(default=timezone.now)
+
+
+# ---------- Archive ----------
+# Cold copies of closed orders and old CRM notes (moved by `manage.py archive_history`)
+# so the hot tables stay small. Field names match the live models so the API can
+# serve both; references outside the archive are plain ids plus a name snapshot.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # original Order.id
+    buyer_contact = models.BigIntegerField(null=True, blank=True)
+    buyer_name = models.CharField(max_length=255, blank=True, null=True)
+    channel = models.CharField(max_length=20, choices=Order.Channel.choices)
+    consignment = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    subtotal_cents = models.IntegerField(default=0)
+    tax_cents = models.IntegerField(default=0)
+    shipping_cents = models.IntegerField(default=0)
+    total_cents = models.IntegerField(default=0)
+    created_at = models.DateTimeField(db_index=True)
+    paid_at = models.DateTimeField(blank=True, null=True)
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True)  # ingest checks it per chunk
+    tax_jurisdiction = models.CharField(max_length=20, blank=True, default='')
+    archived_at = models.DateTimeField(default=timezone.now)
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    variant = models.BigIntegerField()
+    variant_label = models.CharField(max_length=255, blank=True, null=True)
+    product_title = models.CharField(max_length=255, blank=True, null=True)
+    qty = models.PositiveIntegerField()
+    unit_price_cents = models.PositiveIntegerField()
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='payments')
+    method = models.CharField(max_length=20, choices=Payment.Method.choices)
+    amount_cents = models.PositiveIntegerField()
+    received_at = models.DateTimeField(db_index=True)
+
+
+class ArchivedCrmNote(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    contact = models.BigIntegerField(db_index=True)
+    contact_name = models.CharField(max_length=255, blank=True, null=True)
+    note = models.TextField()
+    created_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,7 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class PageSizePagination(PageNumberPagination):
+    """PAGE_SIZE by default; bulk clients may ask for up to max_page_size rows with ?page_size=."""
+    page_size_query_param = "page_size"
+    max_page_size = 1000
@@ -0,0 +1,249 @@
+"""
+Perceptual hashes for Media images, for finding the same artwork photo
+uploaded more than once (across products and kinds).
+
+Each image gets three 64-bit hashes computed with Pillow + NumPy:
+aHash (8x8 mean), dHash (9x8 horizontal gradient) and pHash (low 8x8 of a
+32x32 DCT). They are stored in MediaFingerprint and kept current from the
+sync change hook for images up to MEDIA_FINGERPRINT_INLINE_MAX_SIZE; larger
+ones stay stale until `manage.py cluster_media` hashes them in worker
+processes (duplicates_of() still hashes a stale image on demand). Lookups go through an in-memory BK-tree over pHash,
+rebuilt only when the fingerprint table changes, so a query touches a
+small fraction of the library instead of comparing against every image.
+"""
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from . import models, sync
+
+log = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 8  # pHash bits; resized/re-encoded copies are typically < 6, different works > 20
+
+_MASK = (1 << 64) - 1
+
+# what opening/decoding a bad or oversized file can raise (hashes() reports
+# Pillow's DecompressionBombError as ValueError)
+UNREADABLE = (OSError, ValueError)
+
+
+# Pillow and numpy are imported lazily: this module is loaded at startup (signal
+# hookup), hashing only happens when an image changes or a lookup runs.
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n):
+    import numpy as np
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+def _bits_to_int(bits):
+    import numpy as np
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def _grey(img, size):
+    import numpy as np
+    from PIL import Image
+    return np.asarray(img.resize(size, Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def hashes(fp):
+    """(ahash, dhash, phash) as unsigned 64-bit ints for a path or file object."""
+    import numpy as np
+    from PIL import Image
+    try:
+        with Image.open(fp) as img:
+            img.draft("L", (64, 64))  # JPEG: decode at reduced scale, huge scans stay cheap
+            img = img.convert("L")
+            a = _grey(img, (8, 8))
+            d = _grey(img, (9, 8))
+            dct = _dct_matrix(32)
+            p = dct @ _grey(img, (32, 32)) @ dct.T
+    except Image.DecompressionBombError as exc:
+        raise ValueError(str(exc)) from exc
+    low = p[:8, :8]
+    return (
+        _bits_to_int(a > a.mean()),
+        _bits_to_int(d[:, 1:] > d[:, :-1]),
+        _bits_to_int(low > np.median(low.ravel()[1:])),  # median without the DC term
+    )
+
+
+def to_signed(h):
+    """Unsigned 64-bit hash -> value that fits a BigIntegerField."""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def distance(a, b):
+    return ((a ^ b) & _MASK).bit_count()
+
+
+class BKTree:
+    """Metric tree over Hamming distance; search prunes subtrees by the triangle inequality."""
+
+    def __init__(self):
+        self.root = None  # [hash, [items], {distance: child}]
+        self.size = 0
+
+    def add(self, h, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [h, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = distance(h, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [item], {}]
+                return
+            node = child
+
+    def search(self, h, radius):
+        """[(distance, item)] for every stored hash within `radius` of h."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = distance(h, node[0])
+            if d <= radius:
+                found.extend((d, item) for item in node[1])
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+        return found
+
+
+# ---------- Fingerprints ----------
+
+def _media_path(media):
+    try:
+        return media.image.path
+    except (ValueError, NotImplementedError):
+        return None
+
+
+def fingerprint(media):
+    """Compute and store the fingerprint for one Media row; None if it has no readable image."""
+    if not media.image:
+        models.MediaFingerprint.objects.filter(media=media).delete()
+        return None
+    try:
+        a, d, p = hashes(_media_path(media) or media.image)
+    except UNREADABLE as exc:
+        log.warning("cannot fingerprint media %s (%s): %s", media.pk, media.image.name, exc)
+        return None
+    fp, _ = models.MediaFingerprint.objects.update_or_create(
+        media=media,
+        defaults={"image_name": media.image.name, "ahash": to_signed(a), "dhash": to_signed(d), "phash": to_signed(p)},
+    )
+    return fp
+
+
+def stale_media(ids=None):
+    """Media whose image has no fingerprint or changed since it was computed."""
+    queryset = models.Media.objects.select_related("fingerprint").exclude(image="").exclude(image__isnull=True)
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    return [m for m in queryset if not hasattr(m, "fingerprint") or m.fingerprint.image_name != m.image.name]
+
+
+def _inline_size_ok(media):
+    try:
+        return media.image.size <= settings.MEDIA_FINGERPRINT_INLINE_MAX_SIZE
+    except OSError:
+        return True  # missing file: fingerprint() logs it
+
+
+def _on_changes(sender, ids, deleted, **kwargs):
+    if sender is models.Media and not deleted:
+        for media in stale_media(ids):
+            if _inline_size_ok(media):
+                fingerprint(media)
+            else:
+                log.info("media %s (%s) is too large to fingerprint inline; left for cluster_media",
+                         media.pk, media.image.name)
+
+
+def connect_signals():
+    sync.changes_recorded.connect(_on_changes, dispatch_uid="media-phash")
+
+
+# ---------- Index ----------
+
+_index = {"version": None, "tree": None, "rows": None}
+
+
+def index():
+    """
+    BK-tree over all stored pHashes plus {media_id: (ahash, dhash, phash)}.
+    Cached per process; one aggregate query detects inserts, updates and deletes.
+    """
+    agg = models.MediaFingerprint.objects.aggregate(n=Count("pk"), latest=Max("updated_at"))
+    version = (agg["n"], agg["latest"])
+    if _index["version"] != version:
+        rows = {
+            pk: (a & _MASK, d & _MASK, p & _MASK)
+            for pk, a, d, p in models.MediaFingerprint.objects.values_list("media_id", "ahash", "dhash", "phash")
+        }
+        tree = BKTree()
+        for pk, (_, _, p) in rows.items():
+            tree.add(p, pk)
+        _index.update(version=version, tree=tree, rows=rows)
+    return _index["tree"], _index["rows"]
+
+
+def similar(hash_triple, threshold=DEFAULT_THRESHOLD, exclude=None):
+    """[{media, phash, dhash, ahash}] distances for indexed media within `threshold` pHash bits, closest first."""
+    a, d, p = hash_triple
+    tree, rows = index()
+    matches = []
+    for dist, pk in tree.search(p, threshold):
+        if pk == exclude:
+            continue
+        ra, rd, _ = rows[pk]
+        matches.append({"media": pk, "phash": dist, "dhash": distance(d, rd), "ahash": distance(a, ra)})
+    matches.sort(key=lambda m: (m["phash"], m["dhash"], m["ahash"], m["media"]))
+    return matches
+
+
+def duplicates_of(media, threshold=DEFAULT_THRESHOLD):
+    fp = getattr(media, "fingerprint", None)
+    if fp is None or fp.image_name != media.image.name:
+        fp = fingerprint(media)
+    if fp is None:
+        return []
+    return similar((fp.ahash & _MASK, fp.dhash & _MASK, fp.phash & _MASK), threshold, exclude=media.pk)
+
+
+def clusters(threshold=DEFAULT_THRESHOLD):
+    """Groups (lists of media ids, 2+ members) of images within `threshold` of each other, chained."""
+    tree, rows = index()
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for pk, (_, _, p) in rows.items():
+        for _, other in tree.search(p, threshold):
+            ra, rb = find(pk), find(other)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+    groups = {}
+    for x in parent:
+        groups.setdefault(find(x), []).append(x)
+    return sorted((sorted(g) for g in groups.values() if len(g) > 1), key=lambda g: g[0])
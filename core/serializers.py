@@ -1,24 +1,115 @@
 ﻿from rest_framework import serializers
-from . import models
+from . import models, uploads
 from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db.models import Prefetch
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def requested_set(request, name):
+    """Comma-separated query param as a set, or None when absent."""
+    params = getattr(request, "query_params", None) or request.GET
+    raw = params.get(name)
+    if raw is None:
+        return None
+    return {part.strip() for part in raw.split(",") if part.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Read requests may narrow and expand the representation:
+      ?fields=id,on_hand      only these fields
+      ?expand=variant         nest the related object (see Meta.expandable) instead of its id
+    Only the top-level serializer reacts (the one built by the view with a
+    request in its context); nested ones render as declared. Unknown names
+    in either param are a 400.
+    `field_sources` names the model attributes a SerializerMethodField reads,
+    so query_plan() can still narrow the SELECT when it is requested.
+    """
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get("context", {}).get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        expand = requested_set(request, "expand") or set()
+        expandable = getattr(self.Meta, "expandable", {})
+        if expand - set(expandable):
+            raise serializers.ValidationError(
+                {"expand": f"unknown: {', '.join(sorted(expand - set(expandable)))}; "
+                           f"choose from {', '.join(expandable) or 'nothing'}"}
+            )
+        for name, serializer_class in expandable.items():
+            if name in expand:
+                self.fields[name] = serializer_class(read_only=True)
+        only = requested_set(request, "fields")
+        if only is not None:
+            if only - set(self.fields):
+                raise serializers.ValidationError(
+                    {"fields": f"unknown: {', '.join(sorted(only - set(self.fields)))}; "
+                               f"choose from {', '.join(self.fields)}"}
+                )
+            for name in set(self.fields) - only:
+                self.fields.pop(name)
+
+    def query_plan(self, prefix=""):
+        """
+        (select_related paths, prefetch_related lookups, only() paths or None)
+        needed to render the current field set. None for only() means some
+        field's source is unknown, so columns shouldn't be restricted.
+        """
+        model = self.Meta.model
+        select, prefetch, only = [], [], [prefix + model._meta.pk.name]
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                child_select, _, _ = field.child.query_plan()
+                queryset = field.child.Meta.model.objects.select_related(*child_select)
+                prefetch.append(Prefetch(prefix + field.source, queryset=queryset))
+                continue
+            if isinstance(field, DynamicFieldsMixin):
+                select.append(prefix + field.source)
+                sub_select, sub_prefetch, sub_only = field.query_plan(prefix + field.source + "__")
+                select += sub_select
+                prefetch += sub_prefetch
+                only = None if only is None or sub_only is None else only + sub_only
+                continue
+            if field.source == "*":
+                sources = self.field_sources.get(name)
+                if sources is None:
+                    only = None
+                elif only is not None:
+                    only += [prefix + src for src in sources]
+                continue
+            attrs = field.source.split(".")
+            if len(attrs) > 1:
+                select.append(prefix + "__".join(attrs[:-1]))
+            if only is not None:
+                only.append(prefix + "__".join(attrs))
+        return select, prefetch, only
 
 # -------- Catalog --------
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Product
         fields = "__all__"
 
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+class ProductVariantSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product_title = serializers.CharField(source="product.title", read_only=True)
     # Readable price (e.g., "19.99")
     price = serializers.SerializerMethodField(read_only=True)
     # Optional write-only field so clients can POST/PUT in dollars
     price_dollars = serializers.CharField(write_only=True, required=False)
+    field_sources = {"price": ["price_cents"]}
 
     class Meta:
         model = models.ProductVariant
         fields = "__all__"  # includes price_cents
+        expandable = {"product": ProductSerializer}
         # or explicitly include: ["id","product","option_label","price_cents","price","price_dollars",...]
 
     def get_price(self, obj):
@@ -43,13 +134,15 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         validated_data = self._assign_price_cents(validated_data)
         return super().update(instance, validated_data)
 
-class MediaSerializer(serializers.ModelSerializer):
+class MediaSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product_title = serializers.CharField(source="product.title", read_only=True)
     file_url = serializers.SerializerMethodField(read_only=True)
+    field_sources = {"file_url": ["image"]}
 
     class Meta:
         model = models.Media
         fields = "__all__"  # includes 'image'
+        expandable = {"product": ProductSerializer}
 
     def get_file_url(self, obj):
         request = self.context.get("request")
@@ -57,26 +150,68 @@ class MediaSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+class MediaUploadSerializer(serializers.ModelSerializer):
+    product = serializers.PrimaryKeyRelatedField(queryset=models.Product.objects.all(), required=False)
+    chunk_size = serializers.IntegerField(min_value=64 * 1024, max_value=64 * 1024 * 1024, required=False)
+    next_chunk = serializers.SerializerMethodField()
+    chunk_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.MediaUpload
+        fields = "__all__"
+        read_only_fields = ["received", "created_at", "updated_at", "completed_at"]
+
+    def get_next_chunk(self, obj):
+        return None if obj.completed_at else uploads.next_chunk(obj)
+
+    def get_chunk_count(self, obj):
+        return uploads.chunk_count(obj)
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"must be between 1 and {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.strip().lower()
+        if value and (len(value) != 64 or any(c not in "0123456789abcdef" for c in value)):
+            raise serializers.ValidationError("must be a hex sha256 digest")
+        return value
+
+    def validate(self, attrs):
+        media = attrs.get("media")
+        if media is not None:
+            # replacing an existing row's image: it keeps its product
+            attrs["product"] = media.product
+        elif "product" not in attrs:
+            raise serializers.ValidationError({"product": "required unless media is given"})
+        attrs.setdefault("chunk_size", settings.CHUNKED_UPLOAD_CHUNK_SIZE)
+        return attrs
+
 
 # -------- Contacts / CRM --------
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Contact
         fields = "__all__"
 
-class CrmNoteSerializer(serializers.ModelSerializer):
+class ContactMergeSerializer(serializers.Serializer):
+    duplicates = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+class CrmNoteSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     contact_name = serializers.CharField(source="contact.name", read_only=True)
     class Meta:
         model = models.CrmNote
         fields = "__all__"
+        expandable = {"contact": ContactSerializer}
 
 # -------- Locations / Inventory --------
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Location
         fields = "__all__"
 
-class InventoryByLocationSerializer(serializers.ModelSerializer):
+class InventoryByLocationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = serializers.CharField(source="variant.product.title", read_only=True)
     variant_label = serializers.CharField(source="variant.option_label", read_only=True)
     location_name = serializers.CharField(source="location.name", read_only=True)
@@ -84,32 +219,78 @@ class InventoryByLocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.InventoryByLocation
         fields = "__all__"
+        expandable = {"variant": ProductVariantSerializer, "location": LocationSerializer}
+
+class StockThresholdSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.StockThreshold
+        fields = "__all__"
+        expandable = {"variant": ProductVariantSerializer, "location": LocationSerializer}
+
+class StockAlertSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    product = serializers.CharField(source="variant.product.title", read_only=True)
+    variant_label = serializers.CharField(source="variant.option_label", read_only=True)
+    location_name = serializers.CharField(source="location.name", read_only=True, default=None)
+
+    class Meta:
+        model = models.StockAlert
+        fields = "__all__"
+        expandable = {"variant": ProductVariantSerializer, "location": LocationSerializer}
 
 # -------- Orders / Payments --------
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     variant_label = serializers.CharField(source="variant.option_label", read_only=True)
     product_title = serializers.CharField(source="variant.product.title", read_only=True)
 
     class Meta:
         model = models.OrderItem
         fields = "__all__"
+        expandable = {"variant": ProductVariantSerializer}
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     buyer_name = serializers.CharField(source="buyer_contact.name", read_only=True)
 
     class Meta:
         model = models.Order
         fields = "__all__"
+        expandable = {"buyer_contact": ContactSerializer}
 
-class PaymentSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        channel = attrs.get("channel", getattr(self.instance, "channel", models.Order.Channel.ONLINE))
+        consignment = attrs.get("consignment", getattr(self.instance, "consignment", None))
+        if consignment is not None and channel != models.Order.Channel.CONSIGNMENT:
+            raise serializers.ValidationError({"consignment": "Only consignment-channel orders can belong to a consignment."})
+        return attrs
+
+class PaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     order_id = serializers.IntegerField(source="order.id", read_only=True)
     class Meta:
         model = models.Payment
         fields = "__all__"
+        expandable = {"order": OrderSerializer}
+
+class TaxRateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.TaxRate
+        fields = "__all__"
+
+    def validate(self, attrs):
+        # the conditional one_base_tax_rate constraint isn't covered by DRF's unique validators
+        current = {f: getattr(self.instance, f, None) for f in ("jurisdiction", "product_type", "valid_from")}
+        row = {**current, **attrs}
+        if row["valid_from"] is None:
+            clash = models.TaxRate.objects.filter(
+                jurisdiction=row["jurisdiction"], product_type=row.get("product_type") or "", valid_from__isnull=True,
+            )
+            if self.instance is not None:
+                clash = clash.exclude(pk=self.instance.pk)
+            if clash.exists():
+                raise serializers.ValidationError("A rate without valid_from already exists for this jurisdiction and product type.")
+        return attrs
 
 # -------- COAs --------
-class CoaCertificateSerializer(serializers.ModelSerializer):
+class CoaCertificateSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product_title = serializers.CharField(source="product.title", read_only=True)
     variant_label = serializers.CharField(source="variant.option_label", read_only=True)
     purchaser_name = serializers.CharField(source="purchaser_contact.name", read_only=True)
@@ -117,20 +298,121 @@ class CoaCertificateSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.CoaCertificate
         fields = "__all__"
+        expandable = {
+            "product": ProductSerializer,
+            "variant": ProductVariantSerializer,
+            "purchaser_contact": ContactSerializer,
+        }
 
 # -------- Consignments --------
-class ConsignmentItemSerializer(serializers.ModelSerializer):
+class ConsignmentItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     variant_label = serializers.CharField(source="variant.option_label", read_only=True)
     product_title = serializers.CharField(source="variant.product.title", read_only=True)
 
     class Meta:
         model = models.ConsignmentItem
         fields = "__all__"
+        expandable = {"variant": ProductVariantSerializer}
 
-class ConsignmentSerializer(serializers.ModelSerializer):
+class ConsignmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = ConsignmentItemSerializer(many=True, read_only=True)
     gallery_name = serializers.CharField(source="gallery_contact.name", read_only=True)
 
     class Meta:
         model = models.Consignment
         fields = "__all__"
+        expandable = {"gallery_contact": ContactSerializer}
+
+# -------- Audit --------
+class AuditEntrySerializer(serializers.ModelSerializer):
+    field_name = serializers.CharField(source="get_field_display", read_only=True)
+    actor_name = serializers.CharField(source="actor.get_username", read_only=True, default=None)
+
+    class Meta:
+        model = models.AuditEntry
+        fields = "__all__"
+
+# -------- Batch ingestion (offline POS) --------
+# Plain integer ids on purpose: FK existence is checked once per batch in
+# core.ingest instead of one query per field.
+class BatchOrderItemSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    qty = serializers.IntegerField(min_value=1)
+    unit_price_cents = serializers.IntegerField(min_value=0)
+
+class BatchPaymentSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=models.Payment.Method.choices)
+    amount_cents = serializers.IntegerField(min_value=0)
+    received_at = serializers.DateTimeField(required=False)
+
+class BatchOrderSerializer(serializers.Serializer):
+    client_key = serializers.CharField(max_length=64)
+    channel = serializers.ChoiceField(choices=models.Order.Channel.choices, default=models.Order.Channel.IN_PERSON)
+    status = serializers.ChoiceField(choices=models.Order.Status.choices, default=models.Order.Status.PAID)
+    buyer_contact = serializers.IntegerField(required=False, allow_null=True)
+    created_at = serializers.DateTimeField(required=False)
+    paid_at = serializers.DateTimeField(required=False, allow_null=True)
+    subtotal_cents = serializers.IntegerField(required=False)
+    tax_jurisdiction = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    tax_cents = serializers.IntegerField(required=False)  # omitted: computed from the tax table
+    shipping_cents = serializers.IntegerField(default=0)
+    total_cents = serializers.IntegerField(required=False)
+    items = BatchOrderItemSerializer(many=True, allow_empty=False)
+    payments = BatchPaymentSerializer(many=True, required=False, default=list)
+
+class OrderBatchSerializer(serializers.Serializer):
+    location = serializers.PrimaryKeyRelatedField(queryset=models.Location.objects.all())
+    orders = BatchOrderSerializer(many=True, allow_empty=False)
+
+    def validate_orders(self, orders):
+        keys = [o["client_key"] for o in orders]
+        if len(keys) != len(set(keys)):
+            raise serializers.ValidationError("client_key values must be unique within a batch")
+        return orders
+
+# -------- Archive (read-only, same shape as the live serializers) --------
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.ArchivedOrderItem
+        fields = "__all__"
+
+class ArchivedPaymentSerializer(serializers.ModelSerializer):
+    order_id = serializers.IntegerField(read_only=True)
+    class Meta:
+        model = models.ArchivedPayment
+        fields = "__all__"
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = models.ArchivedOrder
+        fields = "__all__"
+
+class ArchivedCrmNoteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.ArchivedCrmNote
+        fields = "__all__"
+
+# -------- Stock transfers / cycle counts --------
+class StockMoveSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    from_location = serializers.IntegerField()
+    to_location = serializers.IntegerField()
+    qty = serializers.IntegerField(min_value=1)
+
+    def validate(self, attrs):
+        if attrs["from_location"] == attrs["to_location"]:
+            raise serializers.ValidationError("from_location and to_location must differ")
+        return attrs
+
+class StockTransferSerializer(serializers.Serializer):
+    moves = StockMoveSerializer(many=True, allow_empty=False)
+
+class StockCountLineSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    location = serializers.IntegerField()
+    counted = serializers.IntegerField(min_value=0)
+
+class StockCountSerializer(serializers.Serializer):
+    counts = StockCountLineSerializer(many=True, allow_empty=False)
@@ -0,0 +1,125 @@
+"""
+Consignment settlement: what each gallery owes us for a date range.
+
+Everything is aggregated in the database (one grouped query for live and
+archived sales, one for consigned stock); Python only does the Decimal
+commission math per consignment, never per order line.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import models
+
+SETTLED_STATUSES = (models.Order.Status.PAID, models.Order.Status.FULFILLED)
+
+STATEMENT_COLUMNS = [
+    "gallery_id", "gallery_name", "consignment_id", "commission_rate",
+    "consigned_qty", "sold_qty", "gross_cents", "commission_cents", "net_cents",
+]
+
+
+def _bounds(start, end):
+    """Turn inclusive dates into an aware [start, end + 1 day) datetime range."""
+    tz = timezone.get_current_timezone()
+    lo = timezone.make_aware(datetime.combine(start, time.min), tz)
+    hi = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    return lo, hi
+
+
+def commission_cents(gross_cents: int, rate: Decimal) -> int:
+    """Gallery commission on `gross_cents` at `rate` percent, rounded half-up to the cent."""
+    return int((Decimal(gross_cents) * rate / Decimal(100)).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def _sales(model, lo, hi, gallery):
+    """(consignment, sold_qty, gross_cents) per consignment from OrderItem or ArchivedOrderItem."""
+    sales = model.objects.filter(
+        order__channel=models.Order.Channel.CONSIGNMENT,
+        order__consignment__isnull=False,
+        order__status__in=SETTLED_STATUSES,
+        order__created_at__gte=lo,
+        order__created_at__lt=hi,
+    )
+    if gallery is not None:
+        # ArchivedOrder.consignment is a plain id, so filter both through the Consignment ids
+        sales = sales.filter(order__consignment__in=models.Consignment.objects.filter(gallery_contact=gallery).values("pk"))
+    return (
+        sales.values(consignment_id=F("order__consignment"))
+        .annotate(sold_qty=Sum("qty"), gross_cents=Sum(F("qty") * F("unit_price_cents")))
+        .order_by()
+    )
+
+
+def consignment_rows(start, end, gallery=None):
+    """
+    One row per consignment with sales in [start, end] (inclusive dates).
+    Sales are consignment-channel orders linked via Order.consignment, live
+    or already moved to the archive (core.archive); a consignment set on an
+    order of another channel is not billed (Order.clean rejects it).
+    """
+    lo, hi = _bounds(start, end)
+    totals = {}
+    live, archived = _sales(models.OrderItem, lo, hi, gallery), _sales(models.ArchivedOrderItem, lo, hi, gallery)
+    for r in live.union(archived, all=True):
+        t = totals.setdefault(r["consignment_id"], [0, 0])
+        t[0] += r["sold_qty"] or 0
+        t[1] += r["gross_cents"] or 0
+
+    consignments = models.Consignment.objects.filter(pk__in=totals).select_related("gallery_contact")
+    consignments = sorted(consignments, key=lambda c: (c.gallery_contact.name, c.pk))
+
+    consigned = dict(
+        models.ConsignmentItem.objects.filter(consignment__in=totals)
+        .values_list("consignment")
+        .annotate(total=Sum("qty"))
+        .order_by()
+    )
+
+    rows = []
+    for c in consignments:
+        sold_qty, gross = totals[c.pk]
+        commission = commission_cents(gross, c.commission_rate)
+        rows.append({
+            "gallery_id": c.gallery_contact_id,
+            "gallery_name": c.gallery_contact.name,
+            "consignment_id": c.pk,
+            "commission_rate": f"{c.commission_rate:.2f}",
+            "consigned_qty": consigned.get(c.pk, 0),
+            "sold_qty": sold_qty,
+            "gross_cents": gross,
+            "commission_cents": commission,
+            "net_cents": gross - commission,
+        })
+    return rows
+
+
+def gallery_totals(rows):
+    """Roll consignment rows up to one total per gallery (rows are already grouped by gallery)."""
+    totals = {}
+    for r in rows:
+        t = totals.setdefault(r["gallery_id"], {
+            "gallery_id": r["gallery_id"],
+            "gallery_name": r["gallery_name"],
+            "consignments": 0,
+            "sold_qty": 0,
+            "gross_cents": 0,
+            "commission_cents": 0,
+            "net_cents": 0,
+        })
+        t["consignments"] += 1
+        for key in ("sold_qty", "gross_cents", "commission_cents", "net_cents"):
+            t[key] += r[key]
+    return list(totals.values())
+
+
+def settle(start, end, gallery=None):
+    rows = consignment_rows(start, end, gallery=gallery)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "consignments": rows,
+        "galleries": gallery_totals(rows),
+    }
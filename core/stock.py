@@ -0,0 +1,160 @@
+"""
+Bulk stock operations on InventoryByLocation: inter-location transfers and
+cycle counts. Each call runs in one transaction and applies all lines with
+set-based UPDATE ... FROM (VALUES ...) statements, chunked to stay under
+driver parameter limits. The statements work on PostgreSQL and SQLite 3.33+.
+Only the exact (variant, location) rows a call touches are locked.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from . import audit, models, sync
+
+CHUNK = 2000
+
+_UPDATE_SQL = """
+WITH v(variant_id, location_id, val) AS (VALUES {values})
+UPDATE {table} SET on_hand = {expr}
+FROM v
+WHERE {table}.variant_id = v.variant_id AND {table}.location_id = v.location_id
+"""
+
+# joined on the pairs rather than variant IN (...) AND location IN (...), which would lock
+# the whole cross product; id order keeps concurrent calls from deadlocking
+_LOCK_SQL = """
+WITH v(variant_id, location_id) AS (VALUES {values})
+SELECT t.variant_id, t.location_id, t.id, t.on_hand
+FROM {table} t JOIN v ON t.variant_id = v.variant_id AND t.location_id = v.location_id
+ORDER BY t.id {lock}
+"""
+
+
+class InsufficientStock(Exception):
+    """A transfer would take a source below zero; `lines` says where (nothing was applied)."""
+
+    def __init__(self, lines):
+        super().__init__(f"insufficient stock for {len(lines)} line(s)")
+        self.lines = lines
+
+
+def _bulk_set(rows, relative):
+    """rows: [(variant_id, location_id, value)]; on_hand += value if relative else on_hand = value."""
+    table = connection.ops.quote_name(models.InventoryByLocation._meta.db_table)
+    expr = f"{table}.on_hand + v.val" if relative else "v.val"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), CHUNK):
+            chunk = rows[start:start + CHUNK]
+            values = ", ".join(["(CAST(%s AS BIGINT), CAST(%s AS BIGINT), CAST(%s AS BIGINT))"] * len(chunk))
+            params = [p for row in chunk for p in row]
+            cursor.execute(_UPDATE_SQL.format(values=values, table=table, expr=expr), params)
+
+
+def _check_ids(variant_ids, location_ids):
+    missing = {}
+    unknown = set(variant_ids) - set(models.ProductVariant.objects.filter(pk__in=variant_ids).values_list("pk", flat=True))
+    if unknown:
+        missing["variants"] = sorted(unknown)
+    unknown = set(location_ids) - set(models.Location.objects.filter(pk__in=location_ids).values_list("pk", flat=True))
+    if unknown:
+        missing["locations"] = sorted(unknown)
+    if missing:
+        raise ValidationError({"unknown_ids": missing})
+
+
+def _lock_rows(pairs):
+    """
+    Lock and return the inventory rows for the (variant, location) pairs as
+    {(variant_id, location_id): (pk, on_hand)}, creating missing rows at 0.
+    """
+    table = connection.ops.quote_name(models.InventoryByLocation._meta.db_table)
+    if connection.features.has_select_for_update_of:
+        lock = "FOR UPDATE OF t"
+    else:
+        lock = "FOR UPDATE" if connection.features.has_select_for_update else ""
+    ordered = sorted(pairs)
+
+    def fetch():
+        found = {}
+        with connection.cursor() as cursor:
+            for start in range(0, len(ordered), CHUNK):
+                chunk = ordered[start:start + CHUNK]
+                values = ", ".join(["(CAST(%s AS BIGINT), CAST(%s AS BIGINT))"] * len(chunk))
+                cursor.execute(_LOCK_SQL.format(values=values, table=table, lock=lock), [p for pair in chunk for p in pair])
+                found.update({(v, l): (pk, on_hand) for v, l, pk, on_hand in cursor.fetchall()})
+        return found
+
+    current = fetch()
+    missing = pairs - current.keys()
+    if missing:
+        models.InventoryByLocation.objects.bulk_create(
+            [models.InventoryByLocation(variant_id=v, location_id=l, on_hand=0) for v, l in missing],
+            ignore_conflicts=True, batch_size=CHUNK,
+        )
+        current = fetch()
+    return current
+
+
+@transaction.atomic
+def transfer(moves):
+    """
+    moves: [{"variant", "from_location", "to_location", "qty"}].
+    All-or-nothing: if any source would go negative nothing is applied and
+    InsufficientStock is raised.
+    Returns the resulting on_hand per touched (variant, location).
+    """
+    delta = defaultdict(int)
+    for m in moves:
+        delta[(m["variant"], m["from_location"])] -= m["qty"]
+        delta[(m["variant"], m["to_location"])] += m["qty"]
+    _check_ids({v for v, _ in delta}, {l for _, l in delta})
+
+    current = _lock_rows(set(delta))
+    short = [
+        {"variant": v, "location": l, "on_hand": current[(v, l)][1], "requested": -d}
+        for (v, l), d in delta.items() if current[(v, l)][1] + d < 0
+    ]
+    if short:
+        raise InsufficientStock(short)
+
+    changes = [(v, l, d) for (v, l), d in delta.items() if d]
+    _bulk_set(changes, relative=True)
+    sync.record(models.InventoryByLocation, [current[(v, l)][0] for v, l, _ in changes])
+    audit.record(audit.Field.INVENTORY_ON_HAND, [
+        (current[(v, l)][0], current[(v, l)][1], current[(v, l)][1] + d) for v, l, d in changes
+    ], source="transfer")
+    return [
+        {"variant": v, "location": l, "change": d, "on_hand": current[(v, l)][1] + d}
+        for (v, l), d in sorted(delta.items())
+    ]
+
+
+@transaction.atomic
+def cycle_count(counts):
+    """
+    counts: [{"variant", "location", "counted"}]; a later line for the same
+    pair wins. Sets on_hand to the counted quantity and returns the variances.
+    """
+    counted = {(c["variant"], c["location"]): c["counted"] for c in counts}
+    _check_ids({v for v, _ in counted}, {l for _, l in counted})
+
+    current = _lock_rows(set(counted))
+    lines = []
+    changes = []
+    for (v, l), qty in counted.items():
+        pk, expected = current[(v, l)]
+        lines.append({"variant": v, "location": l, "expected": expected, "counted": qty, "variance": qty - expected})
+        if qty != expected:
+            changes.append((v, l, qty))
+    _bulk_set(changes, relative=False)
+    sync.record(models.InventoryByLocation, [current[(v, l)][0] for v, l, _ in changes])
+    audit.record(audit.Field.INVENTORY_ON_HAND, [
+        (current[(v, l)][0], current[(v, l)][1], qty) for v, l, qty in changes
+    ], source="count")
+    return {
+        "lines": len(lines),
+        "adjusted": len(changes),
+        "net_variance": sum(line["variance"] for line in lines),
+        "variances": [line for line in lines if line["variance"]],
+    }
@@ -0,0 +1,41 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_LEN = 12
+HASHED_NAME = re.compile(r"\.[0-9a-f]{%d}\.[^./]+$" % HASH_LEN)
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Stores uploads as <name>.<sha256 prefix>.<ext>, e.g.
+    products/2025/09/sunset.3f9a0c1b22de.jpg. The URL changes whenever the
+    bytes do, so it can be cached forever, and re-uploading identical
+    bytes reuses the existing file instead of writing a copy.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        sha256 = getattr(content, "sha256", None)  # callers that already hashed the bytes (core.uploads)
+        if sha256 is None:
+            digest = hashlib.sha256()
+            for chunk in content.chunks():
+                digest.update(chunk)
+            content.seek(0)
+            sha256 = digest.hexdigest()
+        # always the hash of these bytes: a name that already looks hashed (a file
+        # downloaded from here, then edited) must not resolve to the old file
+        root, ext = os.path.splitext(name)
+        if HASHED_NAME.search(name):
+            root = root[:-(HASH_LEN + 1)]
+        name = f"{root}.{sha256[:HASH_LEN]}{ext}"
+        if self.exists(name):
+            return name.replace("\\", "/")
+        return super().save(name, content, max_length=max_length)
+
+
+def is_hashed(name: str) -> bool:
+    return bool(HASHED_NAME.search(name))
@@ -0,0 +1,168 @@
+"""
+Delta sync for POS tablets and the storefront.
+
+Saves and deletes of the synced models append to SyncChange (after the
+transaction commits, so sequence order follows commit order). Code that
+bypasses signals (bulk_create, queryset.update) must call record().
+A client keeps the last token it saw and asks for everything after it;
+the work done is proportional to the number of changes, not the catalog.
+
+Because entries are written in an on_commit callback, a process that dies
+between the data commit and that callback loses them: clients keep the
+stale row until it changes again. Entries can't go in the data transaction
+instead, as a transaction open longer than SETTLE would then publish ids
+behind tokens already handed out, which clients skip for good.
+
+compact() (`manage.py compact_sync`) keeps the feed from growing without
+bound. Below a horizon it keeps only the latest entry per row and drops the
+tombstones. A token older than the horizon may have missed those deletes,
+so changes_since() refuses it with StaleToken, and the client resyncs from 0.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import models
+
+# feed key -> (model, serializer name in core.serializers, select_related used to render it).
+# Serializers are looked up on first use so the signal hookup in CoreConfig.ready()
+# doesn't pull DRF into every django.setup() (management commands, cron).
+SYNC_MODELS = {
+    "products": (models.Product, "ProductSerializer", ()),
+    "variants": (models.ProductVariant, "ProductVariantSerializer", ("product",)),
+    "inventory": (models.InventoryByLocation, "InventoryByLocationSerializer", ("variant__product", "location")),
+    "media": (models.Media, "MediaSerializer", ("product",)),
+}
+_KEY_FOR_MODEL = {model: key for key, (model, _, _) in SYNC_MODELS.items()}
+
+# sent after commit with sender=<model>, ids=[...], deleted=bool for every
+# recorded change (including bulk paths), so consumers like core.alerts can
+# react to exactly the rows that changed
+changes_recorded = Signal()
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+# entries younger than this are held back so a slow concurrent commit can't
+# land behind a token we've already handed out
+SETTLE = timedelta(seconds=2)
+DEFAULT_RETENTION = timedelta(days=30)
+
+
+class StaleToken(Exception):
+    """The token predates the compaction horizon; the client must resync from 0."""
+
+    def __init__(self, since, horizon):
+        super().__init__(f"token {since} is older than the sync horizon {horizon}; resync from 0")
+        self.since, self.horizon = since, horizon
+
+
+def record(model, ids, deleted=False):
+    """Queue change entries for `ids` of a synced model; written once the current transaction commits."""
+    key = _KEY_FOR_MODEL[model]
+    ids = list(ids)
+    if not ids:
+        return
+
+    def flush():
+        models.SyncChange.objects.bulk_create(
+            [models.SyncChange(model=key, object_id=pk, deleted=deleted) for pk in ids], batch_size=2000,
+        )
+        changes_recorded.send(sender=model, ids=ids, deleted=deleted)
+
+    transaction.on_commit(flush)
+
+
+def _on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record(sender, [instance.pk])
+
+
+def _on_delete(sender, instance, **kwargs):
+    record(sender, [instance.pk], deleted=True)
+
+
+def connect_signals():
+    for model, _, _ in SYNC_MODELS.values():
+        post_save.connect(_on_save, sender=model, dispatch_uid=f"sync-save-{model.__name__}")
+        post_delete.connect(_on_delete, sender=model, dispatch_uid=f"sync-delete-{model.__name__}")
+
+
+def horizon():
+    """Sequence up to which the feed has been compacted (0 = never)."""
+    last = models.SyncCompaction.objects.order_by("-id").values_list("horizon", flat=True).first()
+    return last or 0
+
+
+def changes_since(since, limit=DEFAULT_LIMIT, request=None):
+    """
+    Changes with sequence > `since`. Several entries for one row collapse to
+    its latest state: the current serialized row, or a tombstone if it is gone.
+    Raises StaleToken for a non-zero `since` below the compaction horizon.
+    """
+    if since:
+        floor = horizon()
+        if since < floor:
+            raise StaleToken(since, floor)
+    limit = max(1, min(limit, MAX_LIMIT))
+    entries = list(
+        models.SyncChange.objects.filter(id__gt=since, recorded_at__lte=timezone.now() - SETTLE)
+        .order_by("id")
+        .values_list("id", "model", "object_id")[: limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    token = entries[-1][0] if entries else since
+
+    touched = {key: set() for key in SYNC_MODELS}
+    for _, key, object_id in entries:
+        touched[key].add(object_id)
+
+    from . import serializers
+
+    out = {}
+    context = {"request": request}
+    for key, ids in touched.items():
+        model, serializer_name, related = SYNC_MODELS[key]
+        if not ids:
+            out[key] = {"upserts": [], "deletes": []}
+            continue
+        # the live table is the truth: whatever still exists is an upsert, the rest are tombstones
+        rows = model.objects.select_related(*related).in_bulk(ids)
+        out[key] = {
+            "upserts": getattr(serializers, serializer_name)(list(rows.values()), many=True, context=context).data,
+            "deletes": sorted(ids - rows.keys()),
+        }
+    return {"token": str(token), "has_more": has_more, "changes": out}
+
+
+@transaction.atomic
+def compact(retention=DEFAULT_RETENTION, dry_run=False):
+    """
+    Below the newest entry older than `retention`, drop entries superseded by a
+    later one for the same row, then the tombstones left. Returns
+    {"horizon", "superseded", "tombstones"}.
+    """
+    floor = horizon()
+    new_horizon = (
+        models.SyncChange.objects.filter(recorded_at__lt=timezone.now() - retention)
+        .order_by("-id").values_list("id", flat=True).first()
+    )
+    if new_horizon is None or new_horizon <= floor:
+        return {"horizon": floor, "superseded": 0, "tombstones": 0}
+
+    below = models.SyncChange.objects.filter(id__lte=new_horizon)
+    later = models.SyncChange.objects.filter(model=OuterRef("model"), object_id=OuterRef("object_id"), id__gt=OuterRef("id"))
+    superseded = below.filter(Exists(later))
+    # what is left as tombstones once the superseded entries are gone
+    tombstones = below.filter(deleted=True).exclude(Exists(later))
+    if dry_run:
+        return {"horizon": new_horizon, "superseded": superseded.count(), "tombstones": tombstones.count()}
+
+    stats = {"horizon": new_horizon, "superseded": superseded.delete()[0]}
+    stats["tombstones"] = below.filter(deleted=True).delete()[0]
+    models.SyncCompaction.objects.create(horizon=new_horizon, removed=stats["superseded"] + stats["tombstones"])
+    return stats
@@ -0,0 +1,176 @@
+"""
+Sales tax from the local TaxRate table - no external service.
+
+The whole table is held in-process as a RateTable and rebuilt only when a
+cheap (count, max(updated_at)) probe says it changed, the same version check
+core.phash uses. Tax is computed per line (base x summed jurisdiction
+rates, rounded half up) and the order's tax is the sum of its lines. Every
+entry point loads the lines it needs in one query, so nothing issues a
+query per line - including recompute(), which re-taxes historical orders
+in chunks of one SELECT for orders, one for their lines and one bulk UPDATE.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import models
+
+DEFAULT_CHUNK = 2000
+ZERO = Decimal("0")
+
+
+class RateTable:
+    def __init__(self, rows):
+        # (jurisdiction, product_type) -> ([valid_from...], [rate...]) sorted by date; None sorts first
+        grouped = defaultdict(list)
+        for jurisdiction, product_type, rate, valid_from in rows:
+            grouped[(jurisdiction.upper(), product_type)].append((valid_from.toordinal() if valid_from else 0, rate))
+        self._rates = {}
+        for key, entries in grouped.items():
+            entries.sort()
+            self._rates[key] = ([d for d, _ in entries], [r for _, r in entries])
+        self._memo = {}
+
+    def _at(self, key, day):
+        entry = self._rates.get(key)
+        if entry is None:
+            return None
+        i = bisect_right(entry[0], day)
+        return entry[1][i - 1] if i else None
+
+    def rate(self, jurisdiction, product_type, on_date):
+        """Combined rate for a sale of `product_type` in `jurisdiction` on `on_date`."""
+        memo_key = (jurisdiction, product_type, on_date)
+        if memo_key not in self._memo:
+            day = on_date.toordinal()
+            parts = (jurisdiction or "").upper().split("-") if jurisdiction else []
+            total = ZERO
+            for n in range(1, len(parts) + 1):
+                level = "-".join(parts[:n])
+                rate = self._at((level, product_type), day)
+                if rate is None:
+                    rate = self._at((level, ""), day)
+                total += rate or ZERO
+            self._memo[memo_key] = total
+        return self._memo[memo_key]
+
+
+_table = {"version": None, "table": None}
+
+
+def rates():
+    """The current RateTable, rebuilt only when the TaxRate table has changed."""
+    agg = models.TaxRate.objects.aggregate(n=Count("pk"), latest=Max("updated_at"))
+    version = (agg["n"], agg["latest"])
+    if _table["version"] != version:
+        rows = models.TaxRate.objects.values_list("jurisdiction", "product_type", "rate", "valid_from")
+        _table.update(version=version, table=RateTable(rows))
+    return _table["table"]
+
+
+def jurisdiction_for(order_jurisdiction):
+    return order_jurisdiction or getattr(settings, "TAX_DEFAULT_JURISDICTION", "")
+
+
+def line_tax(base_cents, rate):
+    return int((Decimal(base_cents) * rate).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def variant_info(variant_ids):
+    """{variant_id: (taxable, product_type)} in one query."""
+    return {
+        pk: (taxable, product_type)
+        for pk, taxable, product_type in models.ProductVariant.objects.filter(pk__in=set(variant_ids))
+        .values_list("pk", "taxable", "product__product_type")
+    }
+
+
+def order_tax(table, jurisdiction, on_date, lines):
+    """
+    lines: [(taxable, product_type, qty, unit_price_cents)].
+    Returns (per-line [(rate, tax_cents)], order tax_cents).
+    """
+    jurisdiction = jurisdiction_for(jurisdiction)
+    out = []
+    for taxable, product_type, qty, unit_price_cents in lines:
+        rate = table.rate(jurisdiction, product_type, on_date) if taxable else ZERO
+        out.append((rate, line_tax(qty * unit_price_cents, rate)))
+    return out, sum(t for _, t in out)
+
+
+def _order_date(order):
+    return timezone.localdate(order.created_at) if order.created_at else timezone.localdate()
+
+
+def quote(order):
+    """Per-line and total tax for a saved order, without changing it."""
+    items = list(
+        models.OrderItem.objects.filter(order=order).order_by("pk")
+        .values_list("pk", "variant_id", "qty", "unit_price_cents", "variant__taxable", "variant__product__product_type")
+    )
+    lines, total = order_tax(
+        rates(), order.tax_jurisdiction, _order_date(order),
+        [(taxable, ptype, qty, price) for _, _, qty, price, taxable, ptype in items],
+    )
+    return {
+        "order": order.pk,
+        "jurisdiction": jurisdiction_for(order.tax_jurisdiction),
+        "lines": [
+            {"item": pk, "variant": variant, "taxable_cents": qty * price if taxable else 0, "rate": str(rate), "tax_cents": tax}
+            for (pk, variant, qty, price, taxable, _), (rate, tax) in zip(items, lines)
+        ],
+        "tax_cents": total,
+    }
+
+
+def apply(order):
+    """Recompute and save the order's tax_cents/total_cents; returns the quote."""
+    result = quote(order)
+    order.tax_cents = result["tax_cents"]
+    order.total_cents = order.subtotal_cents + order.tax_cents + order.shipping_cents
+    order.save(update_fields=["tax_cents", "total_cents"])
+    return result
+
+
+def recompute(queryset=None, chunk_size=DEFAULT_CHUNK, dry_run=False):
+    """
+    Re-tax every order in `queryset` (default: all live orders) against the
+    current table, chunk by chunk. Returns counts and the net tax change.
+    """
+    queryset = (queryset if queryset is not None else models.Order.objects.all()).order_by("pk").only(
+        "pk", "tax_jurisdiction", "created_at", "subtotal_cents", "tax_cents", "shipping_cents", "total_cents",
+    )
+    table = rates()
+    stats = {"orders": 0, "changed": 0, "tax_delta_cents": 0}
+    last = 0
+    while True:
+        orders = list(queryset.filter(pk__gt=last)[:chunk_size])
+        if not orders:
+            return stats
+        last = orders[-1].pk
+
+        lines = defaultdict(list)
+        for order_id, qty, price, taxable, ptype in (
+            models.OrderItem.objects.filter(order_id__in=[o.pk for o in orders])
+            .values_list("order_id", "qty", "unit_price_cents", "variant__taxable", "variant__product__product_type")
+        ):
+            lines[order_id].append((taxable, ptype, qty, price))
+
+        changed = []
+        for order in orders:
+            _, tax_cents = order_tax(table, order.tax_jurisdiction, _order_date(order), lines[order.pk])
+            if tax_cents != order.tax_cents:
+                stats["tax_delta_cents"] += tax_cents - order.tax_cents
+                order.tax_cents = tax_cents
+                order.total_cents = order.subtotal_cents + tax_cents + order.shipping_cents
+                changed.append(order)
+        stats["orders"] += len(orders)
+        stats["changed"] += len(changed)
+        if changed and not dry_run:
+            with transaction.atomic():
+                models.Order.objects.bulk_update(changed, ["tax_cents", "total_cents"], batch_size=500)
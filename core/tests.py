@@ -1,3 +1,921 @@
-from django.test import TestCase
+import hashlib
+import io
+import random
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient
+
+from . import archive, db_router, dedupe, ingest, models, phash, settlement, storage, sync, tax, views_api
+
+
+def _png(width, height):
+    """PNG bytes of random noise, so the size is not a round number of chunks."""
+    buf = io.BytesIO()
+    Image.frombytes("RGB", (width, height), random.Random(width).randbytes(width * height * 3)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class ChunkedUploadTests(TestCase):
+    CHUNK = 64 * 1024
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmp, CHUNKED_UPLOAD_DIR=f"{self.tmp}/chunks")
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client = APIClient()
+        self.product = models.Product.objects.create(title="Dunes", sku="D1", product_type="original")
+
+    def start(self, data):
+        r = self.client.post("/api/media-uploads/", {
+            "product": self.product.pk, "filename": "scan.png", "size": len(data),
+            "chunk_size": self.CHUNK, "sha256": hashlib.sha256(data).hexdigest(),
+        }, format="json")
+        self.assertEqual(r.status_code, 201, r.content)
+        return r.json()
+
+    def put(self, upload, data, index):
+        body = data[index * self.CHUNK:(index + 1) * self.CHUNK]
+        return self.client.generic(
+            "PUT", f"/api/media-uploads/{upload['id']}/chunks/{index}/", body,
+            content_type="application/octet-stream", HTTP_X_CHUNK_SHA256=hashlib.sha256(body).hexdigest(),
+        )
+
+    def test_single_short_chunk(self):
+        data = _png(8, 8)
+        self.assertLess(len(data), self.CHUNK)
+        upload = self.start(data)
+        self.assertEqual((upload["next_chunk"], upload["chunk_count"]), (0, 1))
+        r = self.put(upload, data, 0)
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual((r.json()["received"], r.json()["next_chunk"]), (len(data), 1))
+
+    def test_resume_uneven_size(self):
+        data = _png(200, 200)
+        self.assertNotEqual(len(data) % self.CHUNK, 0)
+        upload = self.start(data)
+        count = upload["chunk_count"]
+        self.assertEqual(count, -(-len(data) // self.CHUNK))
+
+        self.assertEqual(self.put(upload, data, 0).status_code, 200)
+        # a client resuming asks where to continue
+        state = self.client.get(f"/api/media-uploads/{upload['id']}/").json()
+        self.assertEqual(state["next_chunk"], 1)
+        self.assertEqual(self.put(upload, data, 0).json()["received"], self.CHUNK)  # resent chunk is acknowledged
+        self.assertEqual(self.put(upload, data, 2).status_code, 409)  # out of order
+
+        for index in range(state["next_chunk"], count):
+            r = self.put(upload, data, index)
+            self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual((r.json()["received"], r.json()["next_chunk"]), (len(data), count))
+        # re-sending the short final chunk is acknowledged, not written again
+        self.assertEqual(self.put(upload, data, count - 1).json()["next_chunk"], count)
+
+        r = self.client.post(f"/api/media-uploads/{upload['id']}/complete/")
+        self.assertEqual(r.status_code, 200, r.content)
+        with models.Media.objects.get(pk=r.json()["id"]).image.open("rb") as fh:
+            self.assertEqual(fh.read(), data)
+
+    def upload(self, data, media=None):
+        if media is None:
+            upload = self.start(data)
+        else:
+            r = self.client.post("/api/media-uploads/", {
+                "media": media.pk, "filename": "scan.png", "size": len(data), "chunk_size": self.CHUNK,
+            }, format="json")
+            self.assertEqual(r.status_code, 201, r.content)
+            upload = r.json()
+        for index in range(upload["chunk_count"]):
+            self.assertEqual(self.put(upload, data, index).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post(f"/api/media-uploads/{upload['id']}/complete/")
+        self.assertEqual(r.status_code, 200, r.content)
+        return models.Media.objects.get(pk=r.json()["id"])
+
+    def test_replacing_deletes_the_old_file_once_unused(self):
+        first = self.upload(_png(8, 8))
+        second = self.upload(_png(8, 8))  # same bytes: shares the stored file
+        old = first.image.name
+        self.assertEqual(second.image.name, old)
+        storage = first.image.storage
+
+        self.upload(_png(9, 9), media=first)
+        self.assertTrue(storage.exists(old))  # still used by `second`
+        self.upload(_png(10, 10), media=second)
+        self.assertFalse(storage.exists(old))
+
+    def test_only_a_held_lock_is_a_conflict(self):
+        upload = self.start(_png(8, 8))
+        for sqlstate, expected in (("55P03", 409), ("57014", None)):  # lock not available, query cancelled
+            cause = type("PgError", (Exception,), {"sqlstate": sqlstate})()
+            error = OperationalError("db error")
+            error.__cause__ = cause
+            with self.subTest(sqlstate=sqlstate), \
+                    mock.patch.object(models.MediaUpload.objects, "select_for_update") as select_for_update:
+                select_for_update.return_value.get.side_effect = error
+                if expected is None:
+                    with self.assertRaises(OperationalError):
+                        self.put(upload, _png(8, 8), 0)
+                else:
+                    self.assertEqual(self.put(upload, _png(8, 8), 0).status_code, expected)
+
+
+@override_settings(REPLICA_DATABASES=["replica", "replica_2", "replica_3"])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_one_replica_per_scope(self):
+        router = db_router.ReplicaRouter()
+        self.assertEqual(router.db_for_read(models.Product), "default")
+        for _ in range(20):
+            with db_router.replica_reads():
+                alias = router.db_for_read(models.SyncChange)
+                self.assertIn(alias, ["replica", "replica_2", "replica_3"])
+                self.assertEqual({router.db_for_read(models.Product) for _ in range(20)}, {alias})
+                with db_router.replica_reads():
+                    self.assertEqual(router.db_for_read(models.Product), alias)
+                router.db_for_write(models.Product)
+                self.assertEqual(router.db_for_read(models.Product), "default")
+            with db_router.replica_reads(False):
+                self.assertEqual(router.db_for_read(models.Product), "default")
+
+
+class ContactDedupeTests(TestCase):
+    def pair(self, a, b, phone=None, email_a=None, email_b=None):
+        x = models.Contact.objects.create(kind="collector", name=a, phone=phone, email=email_a)
+        y = models.Contact.objects.create(kind="collector", name=b, phone=phone, email=email_b)
+        return x, y, [c.pk for _, c in dedupe.duplicates_of(x)]
+
+    def test_flagged_without_email(self):
+        for a, b, phone in [
+            ("Jon Smyth", "John Smith", "(503) 555-0101"),
+            ("Katherine Jones", "Kathryn Jones", "503.555.0102"),
+            ("Robert Brown", "Bob Brown", "+1 503 555 0103"),
+            ("Ada Lovelace", "Ada Lovelace", None),
+        ]:
+            with self.subTest(a=a, b=b):
+                _, y, found = self.pair(a, b, phone)
+                self.assertEqual(found, [y.pk])
+
+    def test_not_flagged(self):
+        for a, b, phone in [
+            ("Mary Brown", "John Brown", "503-555-0104"),  # household sharing a phone
+            ("Jon Smyth", "John Smith", None),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(self.pair(a, b, phone)[2], [])
+
+    def test_merge_repoints_archived_history(self):
+        keep, dup, _ = self.pair("Jon Smyth", "John Smith", "5035550107")
+        order = models.ArchivedOrder.objects.create(
+            id=1, buyer_contact=dup.pk, channel="online", status="fulfilled", created_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc),
+        )
+        note = models.ArchivedCrmNote.objects.create(id=1, contact=dup.pk, note="met at fair", created_at=order.created_at)
+        dedupe.merge_contacts(keep, [dup])
+        order.refresh_from_db()
+        note.refresh_from_db()
+        self.assertEqual((order.buyer_contact, note.contact), (keep.pk, keep.pk))
+        self.assertFalse(models.Contact.objects.filter(pk=dup.pk).exists())
+
+    def test_merge_endpoint_validates_ids(self):
+        keep, dup, _ = self.pair("Jon Smyth", "John Smith", "5035550108")
+        url = f"/api/contacts/{keep.pk}/merge/"
+        for body in ({"duplicates": ["x"]}, {"duplicates": []}, {"duplicates": 5}, {}):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 400)
+        r = self.client.post(url, {"duplicates": [dup.pk]}, content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+        self.assertFalse(models.Contact.objects.filter(pk=dup.pk).exists())
+
+    def test_trigram_and_email_blocking(self):
+        # different soundex first letter and initial: only the rare trigram blocks pair them
+        x, y, _ = self.pair("Jonathan Xavier", "Jonathan Zavier")
+        pairs = {(a, b) for _, a, b in dedupe.find_duplicates(dedupe.load_rows(), threshold=0.3)}
+        self.assertIn((x.pk, y.pk), pairs)
+        models.Contact.objects.all().delete()
+        x, y, _ = self.pair("Catherine Jones", "Katherine Jones", email_a="c.jones+art@example.com",
+                            email_b="cjones@example.com")
+        self.assertEqual([(a, b) for _, a, b in dedupe.find_duplicates(dedupe.load_rows())], [(x.pk, y.pk)])
+
+    def test_oversized_blocks_are_logged(self):
+        for name in ("Ann Lee", "Bo Diaz", "Cy Young"):
+            models.Contact.objects.create(kind="collector", name=name, phone="5035550109")
+        with self.assertLogs("core.dedupe", "WARNING") as logs:
+            list(dedupe.find_duplicates(dedupe.load_rows(), max_block_size=2))
+        self.assertTrue(any("p:5035550109" in line for line in logs.output))
+
+    def test_batch_scan_matches_single_lookup(self):
+        self.pair("Jon Smyth", "John Smith", "5035550105")
+        self.pair("Mary Brown", "John Brown", "5035550106")
+        pairs = list(dedupe.find_duplicates(dedupe.load_rows()))
+        self.assertEqual(len(pairs), 1)
+        self.assertGreaterEqual(pairs[0][0], dedupe.DEFAULT_THRESHOLD)
+
+
+# templates render without a collectstatic manifest
+@override_settings(STORAGES={
+    "default": {"BACKEND": "core.storage.HashedMediaStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+class CompressionTests(TestCase):
+    def test_api_compressed_html_not(self):
+        models.Product.objects.bulk_create(
+            models.Product(title=f"Print {i}", sku=f"P{i}", product_type="open_print") for i in range(40)
+        )
+        r = self.client.get("/api/products/", {"format": "json"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(r["Content-Encoding"], "gzip")
+        # CSRF-bearing HTML stays uncompressed (BREACH)
+        r = self.client.get("/admin/login/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(r.status_code, 200)
+        self.assertFalse(r.has_header("Content-Encoding"))
+        r = self.client.get("/api/products/", HTTP_ACCEPT="text/html", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(r.has_header("Content-Encoding"))
+
+
+class HashedMediaStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.storage = storage.HashedMediaStorage(location=self.tmp)
+
+    def test_same_bytes_reuse_file(self):
+        first = self.storage.save("a.png", ContentFile(b"one"))
+        self.assertEqual(self.storage.save("a.png", ContentFile(b"one")), first)
+        self.assertTrue(storage.is_hashed(first))
+
+    def test_hashed_looking_name_is_rehashed(self):
+        first = self.storage.save("a.png", ContentFile(b"one"))
+        # an edited copy of a downloaded file keeps the old hashed name
+        second = self.storage.save(first, ContentFile(b"two"))
+        self.assertNotEqual(second, first)
+        self.assertRegex(second, r"^a\.[0-9a-f]{12}\.png$")
+        with self.storage.open(second) as fh:
+            self.assertEqual(fh.read(), b"two")
+        with self.storage.open(first) as fh:
+            self.assertEqual(fh.read(), b"one")
+
+
+class SettlementTests(TestCase):
+    def test_archived_sales_still_settle(self):
+        gallery = models.Contact.objects.create(kind="gallery", name="North Gallery")
+        consignment = models.Consignment.objects.create(
+            gallery_contact=gallery, start_date=date(2020, 1, 1), commission_rate=Decimal("40.00"),
+        )
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="original")
+        variant = models.ProductVariant.objects.create(product=product, option_label="A", price_cents=1000)
+        models.ConsignmentItem.objects.create(consignment=consignment, variant=variant, qty=5, listed_price_cents=1000)
+        for day, qty in ((2, 1), (3, 2)):
+            order = models.Order.objects.create(
+                channel="consignment", consignment=consignment, status="fulfilled",
+                created_at=datetime(2020, 3, day, 12, tzinfo=dt_timezone.utc),
+            )
+            models.OrderItem.objects.create(order=order, variant=variant, qty=qty, unit_price_cents=1000)
+
+        before = settlement.settle(date(2020, 3, 1), date(2020, 3, 31), gallery=gallery.pk)
+        archive.archive_orders(datetime(2020, 3, 3, tzinfo=dt_timezone.utc))  # moves the first order only
+        self.assertEqual(models.ArchivedOrder.objects.count(), 1)
+        after = settlement.settle(date(2020, 3, 1), date(2020, 3, 31), gallery=gallery.pk)
+        self.assertEqual(after, before)
+        row, = after["consignments"]
+        self.assertEqual((row["sold_qty"], row["gross_cents"], row["commission_cents"]), (3, 3000, 1200))
+        self.assertEqual(settlement.settle(date(2020, 3, 1), date(2020, 3, 31), gallery=gallery.pk + 1)["consignments"], [])
+
+    def test_only_consignment_channel_is_billed(self):
+        gallery = models.Contact.objects.create(kind="gallery", name="North Gallery")
+        consignment = models.Consignment.objects.create(
+            gallery_contact=gallery, start_date=date(2020, 1, 1), commission_rate=Decimal("40.00"),
+        )
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="original")
+        variant = models.ProductVariant.objects.create(product=product, option_label="A", price_cents=1000)
+        order = models.Order.objects.create(channel="online", consignment=consignment, status="paid",
+                                            created_at=datetime(2020, 3, 2, tzinfo=dt_timezone.utc))
+        models.OrderItem.objects.create(order=order, variant=variant, qty=1, unit_price_cents=1000)
+        self.assertEqual(settlement.settle(date(2020, 3, 1), date(2020, 3, 31))["consignments"], [])
+
+        with self.assertRaises(DjangoValidationError):
+            order.full_clean()
+        r = self.client.patch(f"/api/orders/{order.pk}/", {"status": "fulfilled"}, content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("consignment", r.json())
+        r = self.client.patch(f"/api/orders/{order.pk}/", {"channel": "consignment"}, content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+
+    def test_bad_gallery_param(self):
+        for path in ("/api/settlements/", "/api/settlements/statement/"):
+            r = self.client.get(path, {"gallery": "abc"})
+            self.assertEqual(r.status_code, 400)
+            self.assertIn("gallery", r.json())
+
+
+class ArchivedListTests(TestCase):
+    def setUp(self):
+        self.buyer = models.Contact.objects.create(kind="collector", name="Ada Byron")
+        other = models.Contact.objects.create(kind="collector", name="Bea Cole")
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="original")
+        variant = models.ProductVariant.objects.create(product=product, option_label="A", price_cents=1000)
+        self.orders = []
+        for day, buyer, status in ((1, self.buyer, "fulfilled"), (2, other, "cancelled"), (3, self.buyer, "fulfilled"),
+                                   (5, self.buyer, "paid")):
+            order = models.Order.objects.create(buyer_contact=buyer, status=status,
+                                                created_at=datetime(2020, 3, day, tzinfo=dt_timezone.utc))
+            models.OrderItem.objects.create(order=order, variant=variant, qty=1, unit_price_cents=1000)
+            self.orders.append(order.pk)
+        archive.archive_orders(datetime(2020, 3, 4, tzinfo=dt_timezone.utc))  # the first three
+
+    def ids(self, path, **params):
+        r = self.client.get(path, params)
+        self.assertEqual(r.status_code, 200, r.content)
+        return [row["id"] for row in r.json()["results"]]
+
+    def test_archived_list_and_filters(self):
+        first, second, third, live = self.orders
+        self.assertEqual(self.ids("/api/orders/", buyer_contact=self.buyer.pk), [live])
+        self.assertEqual(self.ids("/api/orders/", archived=1, buyer_contact=self.buyer.pk), [third, first])
+        self.assertEqual(self.ids("/api/orders/", archived=1, status="cancelled"), [second])
+        self.assertEqual(self.ids("/api/orders/", archived=1, search=str(third)), [third])
+        self.assertEqual(len(self.ids("/api/order-items/", archived=1, order=first)), 1)
+
+    def test_all_pages_across_both_tables(self):
+        first, _, third, live = self.orders
+        pages = [self.ids("/api/orders/", archived="all", buyer_contact=self.buyer.pk, page_size=2, page=n) for n in (1, 2)]
+        self.assertEqual(pages, [[live, third], [first]])
+        r = self.client.get("/api/orders/", {"archived": "all", "buyer_contact": self.buyer.pk})
+        self.assertEqual(r.json()["count"], 3)
+        live_row, archived_row = r.json()["results"][:2]
+        self.assertIn("archived_at", archived_row)
+        self.assertNotIn("archived_at", live_row)
+
+
+class OrderIngestTests(TestCase):
+    def setUp(self):
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="limited_print")
+        self.stocked = models.ProductVariant.objects.create(product=product, option_label="A", price_cents=1000)
+        self.unstocked = models.ProductVariant.objects.create(product=product, option_label="B", price_cents=1000)
+        self.location = models.Location.objects.create(name="Fair booth")
+        self.inventory = models.InventoryByLocation.objects.create(variant=self.stocked, location=self.location, on_hand=10)
+
+    def order(self, key, status, variant, qty):
+        return {"client_key": key, "status": status, "channel": "in_person", "tax_cents": 0, "shipping_cents": 0,
+                "items": [{"variant": variant.pk, "qty": qty, "unit_price_cents": 1000}], "payments": []}
+
+    def test_only_sold_orders_take_stock(self):
+        result = ingest.ingest_orders(self.location, [
+            self.order("a", "paid", self.stocked, 2),
+            self.order("b", "cancelled", self.stocked, 5),
+            self.order("c", "pending", self.stocked, 1),
+            self.order("d", "fulfilled", self.unstocked, 1),
+        ])
+        self.assertEqual(len(result["created"]), 4)
+        self.assertEqual(result["missing_inventory"], [self.unstocked.pk])
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.on_hand, 8)
+        self.stocked.refresh_from_db()
+        self.unstocked.refresh_from_db()
+        self.assertEqual((self.stocked.edition_sold, self.unstocked.edition_sold), (2, 1))
+
+    def test_oversold_lines_are_reported_per_order(self):
+        result = ingest.ingest_orders(self.location, [
+            self.order("a", "paid", self.stocked, 6),
+            self.order("b", "paid", self.stocked, 6),
+            self.order("c", "fulfilled", self.stocked, 1),
+        ], chunk_size=2)
+        self.assertEqual(result["oversold"], [
+            {"client_key": "b", "variant": self.stocked.pk, "short": 2},
+            {"client_key": "c", "variant": self.stocked.pk, "short": 1},
+        ])
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.on_hand, 0)
+        self.stocked.refresh_from_db()
+        self.assertEqual(self.stocked.edition_sold, 13)
+
+
+class StockTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="open_print")
+        self.a4 = models.ProductVariant.objects.create(product=product, option_label="A4", price_cents=1000)
+        self.a3 = models.ProductVariant.objects.create(product=product, option_label="A3", price_cents=2000)
+        self.studio = models.Location.objects.create(name="Studio")
+        self.booth = models.Location.objects.create(name="Fair booth")
+        for variant, location, on_hand in ((self.a4, self.studio, 10), (self.a3, self.studio, 2), (self.a3, self.booth, 1)):
+            models.InventoryByLocation.objects.create(variant=variant, location=location, on_hand=on_hand)
+
+    def on_hand(self):
+        return {(v, l): n for v, l, n in models.InventoryByLocation.objects.values_list("variant", "location", "on_hand")}
+
+    def post(self, path, body):
+        return self.client.post(f"/api/inventory/{path}/", body, format="json")
+
+    def test_transfer_creates_missing_rows(self):
+        r = self.post("transfer", {"moves": [
+            {"variant": self.a4.pk, "from_location": self.studio.pk, "to_location": self.booth.pk, "qty": 3},
+            {"variant": self.a3.pk, "from_location": self.studio.pk, "to_location": self.booth.pk, "qty": 2},
+        ]})
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(self.on_hand(), {
+            (self.a4.pk, self.studio.pk): 7, (self.a4.pk, self.booth.pk): 3,
+            (self.a3.pk, self.studio.pk): 0, (self.a3.pk, self.booth.pk): 3,
+        })
+
+    def test_insufficient_stock_applies_nothing(self):
+        before = self.on_hand()
+        r = self.post("transfer", {"moves": [
+            {"variant": self.a4.pk, "from_location": self.studio.pk, "to_location": self.booth.pk, "qty": 1},
+            {"variant": self.a3.pk, "from_location": self.booth.pk, "to_location": self.studio.pk, "qty": 4},
+        ]})
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json(), {"insufficient_stock": [
+            {"variant": self.a3.pk, "location": self.booth.pk, "on_hand": 1, "requested": 4},
+        ]})
+        self.assertEqual(self.on_hand(), before)
+
+    def test_count_reports_variance(self):
+        r = self.post("count", {"counts": [
+            {"variant": self.a4.pk, "location": self.studio.pk, "counted": 8},
+            {"variant": self.a3.pk, "location": self.studio.pk, "counted": 2},
+            {"variant": self.a4.pk, "location": self.booth.pk, "counted": 1},  # no row yet
+        ]})
+        self.assertEqual(r.status_code, 200, r.content)
+        result = r.json()
+        self.assertEqual((result["lines"], result["adjusted"], result["net_variance"]), (3, 2, -1))
+        self.assertEqual(
+            {(line["variant"], line["location"]): line["variance"] for line in result["variances"]},
+            {(self.a4.pk, self.studio.pk): -2, (self.a4.pk, self.booth.pk): 1},
+        )
+        self.assertEqual(self.on_hand()[(self.a4.pk, self.booth.pk)], 1)
+
+    def test_unknown_ids(self):
+        r = self.post("count", {"counts": [{"variant": 999999, "location": self.studio.pk, "counted": 1}]})
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(list(r.json()["unknown_ids"]), ["variants"])
+
+
+class TaxTests(TestCase):
+    def setUp(self):
+        models.TaxRate.objects.create(jurisdiction="US", rate=Decimal("0.05"))
+        models.TaxRate.objects.create(jurisdiction="US-CA", rate=Decimal("0.0225"))
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="limited_print")
+        variant = models.ProductVariant.objects.create(product=product, option_label="A", price_cents=1000)
+        self.order = models.Order.objects.create(tax_jurisdiction="US-CA", subtotal_cents=2000, total_cents=2000)
+        models.OrderItem.objects.create(order=self.order, variant=variant, qty=2, unit_price_cents=1000)
+
+    def test_tax_endpoint(self):
+        r = self.client.get(f"/api/orders/{self.order.pk}/tax/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["tax_cents"], 145)
+        self.assertEqual(self.client.post(f"/api/orders/{self.order.pk}/tax/").status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.tax_cents, self.order.total_cents), (145, 2145))
+        self.assertEqual(self.client.get("/api/orders/abc/tax/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/orders/{self.order.pk + 1}/tax/").status_code, 404)
+
+    def test_one_base_rate_per_level(self):
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            models.TaxRate.objects.create(jurisdiction="US-CA", rate=Decimal("0.09"))
+        models.TaxRate.objects.create(jurisdiction="US-CA", product_type="original", rate=Decimal("0.01"))
+        models.TaxRate.objects.create(jurisdiction="US-CA", rate=Decimal("0.03"), valid_from=date(2026, 1, 1))
+        r = self.client.post("/api/tax-rates/", {"jurisdiction": "US", "rate": "0.06"}, content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+        base = models.TaxRate.objects.get(jurisdiction="US-CA", product_type="", valid_from=None)
+        r = self.client.patch(f"/api/tax-rates/{base.pk}/", {"rate": "0.025"}, content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+
+
+class StockAlertTests(TestCase):
+    def setUp(self):
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="limited_print")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant = models.ProductVariant.objects.create(
+                product=product, option_label="A", price_cents=1000, edition_size=10, edition_sold=9,
+            )
+            self.location = models.Location.objects.create(name="Gallery")
+            models.InventoryByLocation.objects.create(variant=self.variant, location=self.location, on_hand=2)
+
+    def open_alerts(self, kind):
+        return models.StockAlert.objects.filter(kind=kind, resolved_at__isnull=True).count()
+
+    def test_threshold_and_location_changes_reevaluate(self):
+        low = models.StockAlert.Kind.LOW_STOCK
+        self.assertEqual(self.open_alerts(low), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            threshold = models.StockThreshold.objects.create(variant=self.variant, low_stock_at=3)
+        self.assertEqual(self.open_alerts(low), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.is_sellable = False
+            self.location.save()
+        self.assertEqual(self.open_alerts(low), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.is_sellable = True
+            self.location.save()
+        self.assertEqual(self.open_alerts(low), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            threshold.delete()
+        self.assertEqual(self.open_alerts(low), 0)
+
+    def test_edition_override_reevaluates(self):
+        sellout = models.StockAlert.Kind.EDITION_SELLOUT
+        self.assertEqual(self.open_alerts(sellout), 1)  # 1 left <= EDITION_ALERT_REMAINING
+        with self.captureOnCommitCallbacks(execute=True):
+            models.StockThreshold.objects.create(variant=self.variant, edition_remaining_at=0)
+        self.assertEqual(self.open_alerts(sellout), 0)
+
+
+class AsyncApiTests(TestCase):
+    def setUp(self):
+        models.Product.objects.bulk_create(
+            models.Product(title=f"Print {i:02}", sku=f"P{i}", product_type="open_print") for i in range(12)
+        )
+
+    @staticmethod
+    def decode(response):
+        if response["Content-Type"] == "application/msgpack":
+            return msgpack.unpackb(response.content)
+        return response.json()
+
+    def test_same_data_as_sync_api(self):
+        for params in ({"page_size": 5, "page": 2, "ordering": "title"}, {"page": "last", "page_size": 5},
+                       {"search": "Print 1", "ordering": "-title"},
+                       {"format": "msgpack", "page_size": 3}):
+            with self.subTest(params=params):
+                sync = self.client.get("/api/products/", params)
+                async_ = self.client.get("/api/async/products/", params)
+                self.assertEqual(async_.status_code, sync.status_code)
+                self.assertEqual(async_["Content-Type"], sync["Content-Type"])
+                expected = self.decode(sync)
+                expected.pop("facets", None)  # only the sync list adds facets, and only when asked
+                for link in ("next", "previous"):
+                    expected[link] = expected[link] and expected[link].replace("/api/", "/api/async/")
+                self.assertEqual(self.decode(async_), expected)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get("/api/async/products/", {"page": 99}).status_code, 404)
+        self.assertEqual(self.client.get("/api/async/products/999999/").status_code, 404)
+        self.assertEqual(self.client.get("/api/async/variants/", {"product": "abc"}).status_code, 400)
+        pk = models.Product.objects.first().pk
+        r = self.client.get(f"/api/async/products/{pk}/", {"format": "msgpack"})
+        self.assertEqual((r.status_code, r["Content-Type"]), (200, "application/msgpack"))
+
+    def test_facets_and_unsupported_format(self):
+        params = {"facets": "product_type,available", "product_type": "open_print", "page_size": 5}
+        sync = self.client.get("/api/products/", params).json()
+        async_ = self.client.get("/api/async/products/", params).json()
+        self.assertEqual(async_["facets"], sync["facets"])
+        self.assertEqual(self.client.get("/api/async/products/", {"facets": "colour"}).status_code, 400)
+        r = self.client.get("/api/async/products/", {"format": "api"})
+        self.assertEqual((r.status_code, r["Content-Type"]), (406, "application/json"))
+
+    def test_runs_permission_checks(self):
+        with mock.patch.object(views_api.ProductViewSet, "permission_classes", [IsAuthenticated]):
+            self.assertEqual(self.client.get("/api/async/products/").status_code, 403)
+            user = get_user_model().objects.create_user("staff", password="x")
+            self.client.force_login(user)
+            self.assertEqual(self.client.get("/api/async/products/").status_code, 200)
+
+    async def test_under_asgi(self):
+        r = await self.async_client.get("/api/async/products/", {"page_size": 4})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.json()["count"], len(r.json()["results"])), (12, 4))
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        location = models.Location.objects.create(name="Studio")
+        for i in range(3):
+            product = models.Product.objects.create(title=f"Print {i}", sku=f"S{i}", product_type="open_print")
+            variant = models.ProductVariant.objects.create(product=product, option_label="A4", price_cents=1000)
+            models.InventoryByLocation.objects.create(variant=variant, location=location, on_hand=i)
+            order = models.Order.objects.create()
+            models.OrderItem.objects.create(order=order, variant=variant, qty=1, unit_price_cents=1000)
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"], [q["sql"] for q in ctx.captured_queries]
+
+    def test_fields_select_only_those_columns(self):
+        with self.assertNumQueries(2):  # count + page
+            rows, queries = self.get("/api/inventory/", {"fields": "id,on_hand"})
+        self.assertEqual({tuple(row) for row in rows}, {("id", "on_hand")})
+        page = queries[-1]
+        self.assertNotIn("JOIN", page)
+        columns = page.split(" FROM ")[0]
+        self.assertIn('"on_hand"', columns)
+        self.assertNotIn('"variant_id"', columns)
+        self.assertNotIn('"location_id"', columns)
+
+    def test_expand_joins_and_prefetches(self):
+        rows, queries = self.get("/api/inventory/", {"fields": "id,variant", "expand": "variant"})
+        self.assertEqual(rows[0]["variant"]["option_label"], "A4")
+        self.assertIn("JOIN", queries[-1])
+        self.assertEqual(len(queries), 2)
+
+        # nested lists stay one prefetch query however many orders are on the page
+        with self.assertNumQueries(3):
+            rows, _ = self.get("/api/orders/", {"fields": "id,items"})
+        self.assertEqual([len(row["items"]) for row in rows], [1, 1, 1])
+
+    def test_unknown_names_are_rejected(self):
+        for params in ({"fields": "id,colour"}, {"expand": "buyer"}):
+            with self.subTest(params=params):
+                r = self.client.get("/api/inventory/", params)
+                self.assertEqual(r.status_code, 400)
+                self.assertIn(next(iter(params)), r.json())
+
+
+class SyncFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.location = models.Location.objects.create(name="Studio")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [
+                models.Product.objects.create(title=f"Print {i}", sku=f"F{i}", product_type="open_print") for i in range(5)
+            ]
+
+    def record(self, fn):
+        with self.captureOnCommitCallbacks(execute=True):
+            fn()
+
+    @staticmethod
+    def settle(age=sync.SETTLE * 2):
+        models.SyncChange.objects.update(recorded_at=timezone.now() - age)
+
+    def feed(self, since, **params):
+        r = self.client.get("/api/sync/", {"since": since, **params})
+        self.assertEqual(r.status_code, 200, r.content)
+        return r.json()
+
+    def test_pages_by_token(self):
+        self.settle()
+        seen, token, pages = [], 0, 0
+        while True:
+            page = self.feed(token, limit=2)
+            seen += [row["id"] for row in page["changes"]["products"]["upserts"]]
+            token, pages = page["token"], pages + 1
+            if not page["has_more"]:
+                break
+        self.assertEqual((sorted(seen), pages), (sorted(p.pk for p in self.products), 3))
+        self.assertEqual(self.feed(token)["changes"]["products"]["upserts"], [])
+
+    def test_unsettled_entries_are_held_back(self):
+        self.settle()
+        token = self.feed(0)["token"]
+        self.record(lambda: models.Product.objects.filter(pk=self.products[0].pk).first().save())
+        page = self.feed(token)
+        self.assertEqual((page["token"], page["changes"]["products"]["upserts"]), (token, []))
+        self.settle()
+        self.assertEqual([row["id"] for row in self.feed(token)["changes"]["products"]["upserts"]], [self.products[0].pk])
+
+    def test_cascade_deletes_leave_tombstones(self):
+        product = self.products[0]
+        def build():
+            variant = models.ProductVariant.objects.create(product=product, option_label="A4", price_cents=1000)
+            models.InventoryByLocation.objects.create(variant=variant, location=self.location, on_hand=1)
+        self.record(build)
+        ids = {"products": product.pk, "variants": product.variants.get().pk,
+               "inventory": models.InventoryByLocation.objects.get(variant__product=product).pk}
+        self.settle()
+        token = self.feed(0)["token"]
+
+        self.record(product.delete)
+        self.settle()
+        changes = self.feed(token)["changes"]
+        for key, pk in ids.items():
+            self.assertEqual((changes[key]["deletes"], changes[key]["upserts"]), ([pk], []))
+
+    def test_compaction_and_resync(self):
+        gone = self.products[-1]
+        self.record(lambda: [p.save() for p in self.products[:2]])
+        self.record(gone.delete)
+        old_token = models.SyncChange.objects.order_by("id").first().id
+        self.settle(timedelta(days=40))
+        self.record(self.products[0].save)  # recent: above the horizon
+
+        stats = sync.compact(timedelta(days=30))
+        self.assertEqual((stats["superseded"], stats["tombstones"]), (4, 1))
+        # one entry per surviving row; the deleted row's history is gone entirely
+        self.assertEqual(models.SyncChange.objects.filter(object_id=gone.pk, model="products").count(), 0)
+        self.assertEqual(models.SyncChange.objects.filter(model="products").count(), 4)
+        self.assertEqual(sync.compact(timedelta(days=30))["superseded"], 0)  # idempotent
+
+        r = self.client.get("/api/sync/", {"since": old_token})
+        self.assertEqual((r.status_code, r.json()["resync"]), (410, True))
+        self.settle()
+        upserts = self.feed(0)["changes"]["products"]["upserts"]
+        self.assertEqual(sorted(row["id"] for row in upserts), sorted(p.pk for p in self.products[:-1]))
+
+
+def _artwork(seed, size=(256, 192), fmt="PNG"):
+    """An image with large-scale structure (random blocks), so resized copies keep their perceptual hash."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 90)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, fmt)
+    return buf.getvalue()
+
+
+class PerceptualHashTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        override = override_settings(MEDIA_ROOT=tmp)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+        self.product = models.Product.objects.create(title="Dunes", sku="D1", product_type="original")
+
+    def media(self, data, name="work.png"):
+        with self.captureOnCommitCallbacks(execute=True):
+            media = models.Media(product=self.product, kind="primary")
+            media.image.save(name, ContentFile(data), save=True)
+        return media
+
+    def test_hashes_survive_resizing_and_reencoding(self):
+        original = phash.hashes(io.BytesIO(_artwork(1)))
+        self.assertTrue(all(0 <= h < 1 << 64 for h in original))
+        with Image.open(io.BytesIO(_artwork(1))) as img:
+            buf = io.BytesIO()
+            img.resize((128, 96)).save(buf, "JPEG", quality=70)
+        copy = phash.hashes(io.BytesIO(buf.getvalue()))
+        other = phash.hashes(io.BytesIO(_artwork(2)))
+        self.assertLessEqual(phash.distance(original[2], copy[2]), 4)
+        self.assertGreater(phash.distance(original[2], other[2]), phash.DEFAULT_THRESHOLD)
+        with self.assertRaises(phash.UNREADABLE):
+            phash.hashes(io.BytesIO(b"not an image"))
+
+    def test_bk_tree_matches_brute_force(self):
+        rng = random.Random(7)
+        stored = [rng.getrandbits(64) for _ in range(300)]
+        stored += [h ^ (1 << rng.randrange(64)) for h in stored[:30]]  # near neighbours
+        tree = phash.BKTree()
+        for i, h in enumerate(stored):
+            tree.add(h, i)
+        for query in stored[:5] + [rng.getrandbits(64)]:
+            for radius in (0, 1, 8, 20):
+                expected = sorted((phash.distance(query, h), i) for i, h in enumerate(stored)
+                                  if phash.distance(query, h) <= radius)
+                self.assertEqual(sorted(tree.search(query, radius)), expected)
+
+    def test_duplicate_endpoints(self):
+        first = self.media(_artwork(1))
+        self.media(_artwork(2))
+        with Image.open(io.BytesIO(_artwork(1))) as img:
+            buf = io.BytesIO()
+            img.resize((200, 150)).save(buf, "JPEG", quality=80)
+        copy = self.media(buf.getvalue(), "copy.jpg")
+
+        r = self.client.get(f"/api/media/{first.pk}/duplicates/")
+        self.assertEqual([row["id"] for row in r.json()], [copy.pk])
+        upload = ContentFile(_artwork(1), name="candidate.png")
+        r = self.client.post("/api/media/duplicates/", {"image": upload}, format="multipart")
+        self.assertEqual([row["id"] for row in r.json()], [first.pk, copy.pk])  # closest first
+        self.assertEqual(r.json()[0]["distance"]["phash"], 0)
+        r = self.client.post("/api/media/duplicates/", {"image": ContentFile(b"nope", name="x.png")}, format="multipart")
+        self.assertEqual(r.status_code, 400)
+
+    def test_large_images_are_left_for_the_batch_job(self):
+        with override_settings(MEDIA_FINGERPRINT_INLINE_MAX_SIZE=100):
+            big = self.media(_artwork(3))
+        small = self.media(_artwork(4))
+        self.assertTrue(models.MediaFingerprint.objects.filter(media=small).exists())
+        self.assertFalse(models.MediaFingerprint.objects.filter(media=big).exists())
+        self.assertEqual([m.pk for m in phash.stale_media()], [big.pk])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "facets"}})
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.shop = models.Location.objects.create(name="Shop", is_sellable=True)
+        self.archive_room = models.Location.objects.create(name="Store room", is_sellable=False)
+        rows = [("original", "Dunes", 1), ("original", "Tides", 0), ("open_print", "Dunes", 5),
+                ("open_print", "Dunes", 0), ("open_print", "Tides", 2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, (product_type, series, on_hand) in enumerate(rows):
+                product = models.Product.objects.create(title=f"Work {i}", sku=f"W{i}", product_type=product_type,
+                                                        series=series)
+                variant = models.ProductVariant.objects.create(product=product, option_label="A", price_cents=1000)
+                models.InventoryByLocation.objects.create(variant=variant, location=self.shop, on_hand=on_hand)
+                models.InventoryByLocation.objects.create(variant=variant, location=self.archive_room, on_hand=3)
+
+    def facets(self, **params):
+        r = self.client.get("/api/products/", {"facets": "product_type,series,available", **params})
+        self.assertEqual(r.status_code, 200, r.content)
+        body = r.json()
+        return body["count"], {name: {c["value"]: c["count"] for c in counts} for name, counts in body["facets"].items()}
+
+    def test_each_facet_ignores_its_own_filter(self):
+        count, facets = self.facets(product_type="original", series="Dunes")
+        self.assertEqual(count, 1)
+        # product_type counts within series=Dunes only, series counts within product_type=original only
+        self.assertEqual(facets["product_type"], {"original": 1, "open_print": 2})
+        self.assertEqual(facets["series"], {"Dunes": 1, "Tides": 1})
+
+    def test_available_counts_only_sellable_stock(self):
+        count, facets = self.facets()
+        self.assertEqual((count, facets["available"]), (5, {True: 3, False: 2}))
+        count, facets = self.facets(available="true")
+        self.assertEqual((count, facets["available"]), (3, {True: 3, False: 2}))
+        self.assertEqual(facets["product_type"], {"original": 1, "open_print": 2})
+
+    def test_recorded_changes_invalidate_the_cache(self):
+        self.assertEqual(self.facets()[1]["product_type"], {"original": 2, "open_print": 3})
+        # a write that bypasses the sync hook is not seen until the cache entry expires...
+        models.Product.objects.filter(sku="W0").update(product_type="open_print")
+        self.assertEqual(self.facets()[1]["product_type"], {"original": 2, "open_print": 3})
+        # ...any recorded change moves every cached key on
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Product.objects.get(sku="W1").save()
+        self.assertEqual(self.facets()[1]["product_type"], {"original": 1, "open_print": 4})
+
+
+class AuditTests(TestCase):
+    def setUp(self):
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="open_print")
+        self.variant = models.ProductVariant.objects.create(product=product, option_label="A4", price_cents=1000)
+
+    def changes(self):
+        return list(models.AuditEntry.objects.filter(field=models.AuditEntry.Field.VARIANT_PRICE)
+                    .order_by("id").values_list("old_value", "new_value", "source"))
+
+    def set_price(self, cents):
+        self.variant.price_cents = cents
+        self.variant.save()
+
+    def test_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_price(1200)  # created and updated in this process
+            self.set_price(1200)  # no change
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_price(1500)
+        self.assertEqual(self.changes(), [("1000", "1200", ""), ("1200", "1500", "")])
+
+    def test_rollback_and_savepoint_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.set_price(1100)
+                raise RuntimeError
+        self.assertEqual(self.changes(), [])
+
+        self.variant.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.set_price(1200)
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    self.set_price(1300)
+                    raise RuntimeError
+        self.assertEqual(self.changes(), [("1000", "1200", "")])
+
+    def test_refresh_resets_the_baseline(self):
+        models.ProductVariant.objects.filter(pk=self.variant.pk).update(price_cents=1400)
+        self.variant.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_price(1600)
+        self.assertEqual(self.changes(), [("1400", "1600", "")])
+
+
+class AuditRequestTests(TransactionTestCase):
+    """Autocommit, as in production: entries reach AuditMiddleware's batch during the request."""
+
+    def test_request_entries_are_attributed_and_written_together(self):
+        product = models.Product.objects.create(title="Dunes", sku="D1", product_type="open_print")
+        variant = models.ProductVariant.objects.create(product=product, option_label="A4", price_cents=1000)
+        inventory = models.InventoryByLocation.objects.create(
+            variant=variant, location=models.Location.objects.create(name="Studio"), on_hand=4,
+        )
+        user = get_user_model().objects.create_user("clerk", password="x")
+        self.client.force_login(user)
+        r = self.client.post("/api/inventory/count/", {"counts": [
+            {"variant": variant.pk, "location": inventory.location_id, "counted": 2},
+        ]}, content_type="application/json")
+        self.assertEqual(r.status_code, 200, r.content)
+        r = self.client.patch(f"/api/variants/{variant.pk}/", {"price_cents": 1800}, content_type="application/json")
+        self.assertEqual(r.status_code, 200, r.content)
+        self.assertEqual(
+            sorted(models.AuditEntry.objects.values_list("field", "old_value", "new_value", "source", "actor")),
+            [(models.AuditEntry.Field.VARIANT_PRICE, "1000", "1800", "api", user.pk),
+             (models.AuditEntry.Field.INVENTORY_ON_HAND, "4", "2", "count", user.pk)],
+        )
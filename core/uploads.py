@@ -0,0 +1,198 @@
+"""
+Resumable chunked uploads for large Media scans.
+
+    POST   /api/media-uploads/                      {filename, size, product, kind, [sha256, chunk_size, media]}
+    PUT    /api/media-uploads/<id>/chunks/<n>/      raw bytes, X-Chunk-Sha256: <hex>
+    GET    /api/media-uploads/<id>/                 -> received / next_chunk, to resume
+    POST   /api/media-uploads/<id>/complete/        -> the Media row
+
+Chunk bodies are streamed from the request straight into a partial file in
+fixed-size blocks, so neither Django nor the worker ever holds a whole chunk
+(let alone the whole scan) in memory. Chunks must arrive in order; a resent
+chunk that was already accepted is acknowledged without being read again.
+"""
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import OperationalError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import models
+
+BLOCK = 1024 * 1024
+DEFAULT_STALE = timedelta(days=2)
+LOCK_NOT_AVAILABLE = "55P03"  # SQLSTATE of a NOWAIT lock that is already held
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Another request is writing to this upload."
+    default_code = "conflict"
+
+
+def _dir(upload):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, str(upload.pk))
+
+
+def part_path(upload):
+    return os.path.join(_dir(upload), "data.part")
+
+
+def chunk_count(upload):
+    return -(-upload.size // upload.chunk_size)
+
+
+def next_chunk(upload):
+    # received only ever ends on a chunk boundary or at size, so rounding up gives
+    # chunk_count once the (possibly short) last chunk is in
+    return -(-upload.received // upload.chunk_size)
+
+
+def _expected_length(upload, index):
+    return min(upload.chunk_size, upload.size - index * upload.chunk_size)
+
+
+def write_chunk(upload_id, index, stream, checksum):
+    """
+    Append chunk `index` from `stream` (a file-like request body). Returns the
+    upload; raises ValidationError on a bad length/checksum (nothing is kept)
+    and UploadConflict for an out-of-order chunk or a concurrent writer.
+    """
+    checksum = (checksum or "").strip().lower()
+    if len(checksum) != 64:
+        raise ValidationError({"detail": "X-Chunk-Sha256 header with the chunk's hex sha256 is required"})
+    with transaction.atomic():
+        # the row lock serializes writers of the same upload (PostgreSQL); it is
+        # held while the chunk streams in, which is bounded by chunk_size
+        upload = _lock_for_write(upload_id)
+        if upload.completed_at:
+            raise UploadConflict("Upload already completed.")
+        expected = next_chunk(upload)
+        if index < expected:
+            return upload  # retry of a chunk we already have
+        if index > expected or index >= chunk_count(upload):
+            raise UploadConflict(f"Expected chunk {expected}.")
+
+        offset = index * upload.chunk_size
+        length = _expected_length(upload, index)
+        digest = hashlib.sha256()
+        written = 0
+        os.makedirs(_dir(upload), exist_ok=True)
+        path = part_path(upload)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as fh:
+            fh.seek(offset)
+            while written <= length:
+                block = stream.read(min(BLOCK, length + 1 - written))
+                if not block:
+                    break
+                fh.write(block)
+                digest.update(block)
+                written += len(block)
+            # anything past the accepted bytes (a failed earlier attempt) is dropped
+            fh.truncate(offset + min(written, length))
+        if written != length:
+            raise ValidationError({"detail": f"chunk {index} must be {length} bytes, got {written}{'+' if written > length else ''}"})
+        if digest.hexdigest() != checksum:
+            raise ValidationError({"detail": f"checksum mismatch for chunk {index}"})
+
+        upload.received = offset + length
+        upload.save(update_fields=["received", "updated_at"])
+        return upload
+
+
+def _lock_for_write(upload_id):
+    """The upload row, locked NOWAIT; a concurrent writer is an UploadConflict, other DB errors propagate."""
+    try:
+        return models.MediaUpload.objects.select_for_update(nowait=True).get(pk=upload_id)
+    except OperationalError as exc:
+        cause = exc.__cause__
+        if LOCK_NOT_AVAILABLE in (getattr(cause, "sqlstate", None), getattr(cause, "pgcode", None)):
+            raise UploadConflict()
+        raise
+
+
+class _AssembledFile(File):
+    """The finished partial file: FileSystemStorage renames it into place instead of copying."""
+    def __init__(self, path, name, sha256):
+        super().__init__(open(path, "rb"), name=name)
+        self._path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete(upload_id):
+    """Verify the assembled file and attach it to a Media row (new, or the one given at creation)."""
+    with transaction.atomic():
+        upload = models.MediaUpload.objects.select_for_update().get(pk=upload_id)
+        if upload.completed_at:
+            return upload.media
+        if upload.received != upload.size:
+            raise UploadConflict(f"Upload incomplete: {upload.received} of {upload.size} bytes, expected chunk {next_chunk(upload)}.")
+
+        path = part_path(upload)
+        sha256 = _file_sha256(path)
+        if upload.sha256 and sha256 != upload.sha256.lower():
+            raise ValidationError({"detail": "checksum mismatch for the assembled file"})
+        from PIL import Image  # only needed here; keeps Pillow out of worker boot
+        try:
+            with Image.open(path):  # identifies the format from the header only
+                pass
+        except OSError:  # includes UnidentifiedImageError
+            raise ValidationError({"detail": "upload is not a readable image"})
+
+        media = upload.media or models.Media(product=upload.product, kind=upload.kind, alt_text=upload.alt_text)
+        replaced = media.image.name
+        content = _AssembledFile(path, upload.filename, sha256)
+        try:
+            media.image.save(upload.filename, content, save=True)
+        finally:
+            content.close()
+        if replaced and replaced != media.image.name:
+            storage = media.image.storage
+            transaction.on_commit(lambda: _delete_if_unused(storage, replaced))
+
+        upload.media = media
+        upload.completed_at = timezone.now()
+        upload.save(update_fields=["media", "completed_at", "updated_at"])
+        transaction.on_commit(lambda: discard(upload))
+        return media
+
+
+def _delete_if_unused(storage, name):
+    # HashedMediaStorage shares one file between identical uploads
+    if not models.Media.objects.filter(image=name).exists():
+        storage.delete(name)
+
+
+def discard(upload):
+    shutil.rmtree(_dir(upload), ignore_errors=True)
+
+
+def purge_stale(older_than):
+    """Delete unfinished uploads (and their partial files) idle for longer than `older_than`."""
+    stale = models.MediaUpload.objects.filter(
+        completed_at__isnull=True, updated_at__lt=timezone.now() - older_than,
+    )
+    count = 0
+    for upload in stale.iterator():
+        discard(upload)
+        upload.delete()
+        count += 1
+    return count
+
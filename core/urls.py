@@ -1,12 +1,16 @@
 ﻿from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views_api import (
-    ProductViewSet, ProductVariantViewSet, MediaViewSet,
+    ProductViewSet, ProductVariantViewSet, MediaViewSet, MediaUploadViewSet,
     ContactViewSet, CrmNoteViewSet,
-    LocationViewSet, InventoryByLocationViewSet,
-    OrderViewSet, OrderItemViewSet, PaymentViewSet,
+    LocationViewSet, InventoryByLocationViewSet, StockThresholdViewSet, StockAlertViewSet,
+    OrderViewSet, OrderItemViewSet, PaymentViewSet, TaxRateViewSet,
     CoaCertificateViewSet,
     ConsignmentViewSet, ConsignmentItemViewSet,
+    SettlementViewSet, SyncViewSet, AuditEntryViewSet,
+)
+from .views_async import (
+    AsyncProductView, AsyncProductVariantView, AsyncMediaView, AsyncInventoryByLocationView,
 )
 
 router = DefaultRouter()
@@ -14,22 +18,45 @@ router = DefaultRouter()
 router.register(r"products", ProductViewSet)
 router.register(r"variants", ProductVariantViewSet)
 router.register(r"media", MediaViewSet)
+router.register(r"media-uploads", MediaUploadViewSet)
 # Contacts / CRM
 router.register(r"contacts", ContactViewSet)
 router.register(r"crm-notes", CrmNoteViewSet)
 # Locations / Inventory
 router.register(r"locations", LocationViewSet)
 router.register(r"inventory", InventoryByLocationViewSet)
+router.register(r"stock-thresholds", StockThresholdViewSet)
+router.register(r"stock-alerts", StockAlertViewSet)
 # Orders / Payments
 router.register(r"orders", OrderViewSet)
 router.register(r"order-items", OrderItemViewSet)
 router.register(r"payments", PaymentViewSet)
+router.register(r"tax-rates", TaxRateViewSet)
 # COAs
 router.register(r"coas", CoaCertificateViewSet)
 # Consignments
 router.register(r"consignments", ConsignmentViewSet)
 router.register(r"consignment-items", ConsignmentItemViewSet)
+router.register(r"settlements", SettlementViewSet, basename="settlement")
+# Delta sync (POS / storefront)
+router.register(r"sync", SyncViewSet, basename="sync")
+# Audit history (price / on_hand / order status)
+router.register(r"audit", AuditEntryViewSet)
+
+# Async read-only mirrors of the catalog/inventory endpoints (ASGI workers)
+async_urls = []
+for prefix, view in [
+    ("products", AsyncProductView),
+    ("variants", AsyncProductVariantView),
+    ("media", AsyncMediaView),
+    ("inventory", AsyncInventoryByLocationView),
+]:
+    async_urls += [
+        path(f"{prefix}/", view.as_view(), name=f"async-{prefix}-list"),
+        path(f"{prefix}/<int:pk>/", view.as_view(), name=f"async-{prefix}-detail"),
+    ]
 
 urlpatterns = [
+    path("api/async/", include(async_urls)),
     path("api/", include(router.urls)),
 ]
@@ -1,3 +1,108 @@
-from django.shortcuts import render
+import mimetypes
+import os
+import re
 
-# Create your views here.
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+FOREVER = "public, max-age=31536000, immutable"
+
+
+class _FileRange:
+    """
+    Bytes [start, start + length) of an open file. Keeps fileno() so gunicorn
+    can still sendfile() it (bounded by Content-Length); other servers read
+    through read(), which stops at the end of the range.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self._f = f
+        self._left = length
+        self.name = f.name
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b""
+        size = self._left if size is None or size < 0 else min(size, self._left)
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single-range header, None to send it all, or False if unsatisfiable."""
+    m = RANGE.match(header or "")
+    if not m or (not m[1] and not m[2]):
+        return None
+    if m[1]:
+        start = int(m[1])
+        end = min(int(m[2]), size - 1) if m[2] else size - 1
+    else:
+        start, end = max(size - int(m[2]), 0), size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an uploaded file from MEDIA_ROOT with ETag/conditional GET and
+    single byte-range support. The file object is handed to the WSGI server,
+    so gunicorn sends it with sendfile() instead of copying through Python.
+    """
+    fullpath = safe_join(settings.MEDIA_ROOT, path)
+    try:
+        st = os.stat(fullpath)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    etag = quote_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": FOREVER if is_hashed(path) else "public, max-age=3600",
+    }
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+        for k, v in headers.items():
+            response[k] = v
+        return response
+
+    content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if if_range is None or if_range in (etag, headers["Last-Modified"]):
+        byte_range = _byte_range(request.headers.get("Range"), st.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{st.st_size}"
+        return response
+
+    f = open(fullpath, "rb")
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(_FileRange(f, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    else:
+        response = FileResponse(f, content_type=content_type)
+    for k, v in headers.items():
+        response[k] = v
+    return response
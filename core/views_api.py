@@ -1,105 +1,500 @@
-﻿from rest_framework import viewsets, permissions
-from . import models, serializers
+﻿import csv
+import io
+from itertools import chain
+
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import mixins, viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from . import db_router, dedupe, facets, filters, ingest, models, phash, serializers, settlement, stock, sync, tax, uploads
 
 class DefaultPerms(permissions.AllowAny):  # open during development
     pass
 
+
+class SparseFieldsetMixin:
+    """
+    With ?fields= / ?expand= on a read, rebuild select_related/prefetch_related
+    and only() from what the serializer will actually render, so narrow
+    requests produce narrow SQL.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.request
+        if request.method not in serializers.SAFE_METHODS:
+            return queryset
+        if serializers.requested_set(request, "fields") is None and serializers.requested_set(request, "expand") is None:
+            return queryset
+        select, prefetch, only = self.get_serializer().query_plan()
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+class _ChainedRows:
+    """Several querysets as one sequence for the paginator: counted once, sliced across the seams."""
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def count(self):
+        if self._counts is None:
+            self._counts = [qs.count() for qs in self.querysets]
+        return sum(self._counts)
+
+    def __iter__(self):
+        return chain(*self.querysets)
+
+    def __getitem__(self, bounds):  # Paginator.page() slices with ints
+        self.count()
+        rows, offset = [], 0
+        for qs, n in zip(self.querysets, self._counts):
+            lo, hi = max(bounds.start - offset, 0), min(bounds.stop - offset, n)
+            if lo < hi:
+                rows += qs[lo:hi]
+            offset += n
+        return rows
+
+class ArchiveFallbackMixin:
+    """
+    Transparent reads of archived history (see core.archive). Lists show live
+    rows only by default, so a filtered list (?buyer_contact=N) leaves out
+    archived history unless asked for:
+      ?archived=1    the archive table instead of the live one
+      ?archived=all  live rows, then archived ones, filtered and searched alike;
+                     ?ordering= applies within each part
+    Retrieving an id that has been archived falls back to the archive. Archived rows are read-only.
+    """
+    archive_queryset = None
+    archive_serializer_class = None
+    archive_search_fields = None
+    _from_archive = False
+    _with_archive = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in serializers.SAFE_METHODS:
+            return
+        archived = request.query_params.get("archived")
+        if archived in ("1", "true"):
+            self._from_archive = True
+        elif archived == "all":
+            self._with_archive = True
+
+    def list(self, request, *args, **kwargs):
+        if not self._with_archive:
+            return super().list(request, *args, **kwargs)
+        live = self.filter_queryset(self.get_queryset())
+        live_serializer_class = self.get_serializer_class()
+        self._from_archive = True
+        rows = _ChainedRows(live, self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        objs = list(rows) if page is None else page
+        # live rows always come first on a page
+        split = next((i for i, obj in enumerate(objs) if isinstance(obj, self.archive_queryset.model)), len(objs))
+        context = self.get_serializer_context()
+        data = [
+            *live_serializer_class(objs[:split], many=True, context=context).data,
+            *self.archive_serializer_class(objs[split:], many=True, context=context).data,
+        ]
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+    def get_queryset(self):
+        if not self._from_archive:
+            return super().get_queryset()
+        if self.archive_search_fields is not None:
+            self.search_fields = self.archive_search_fields
+        return self.archive_queryset.all()
+
+    def get_serializer_class(self):
+        if self._from_archive:
+            return self.archive_serializer_class
+        return super().get_serializer_class()
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self._from_archive or self.request.method not in serializers.SAFE_METHODS:
+                raise
+            self._from_archive = True
+            return super().get_object()
+
+class AuditHistoryMixin:
+    """GET <detail>/history/[?since=&until=] - the object's audit entries, newest first (see core.audit)."""
+    audit_field = None
+
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        try:
+            object_id = int(pk)
+        except ValueError:
+            raise Http404
+        entries = audit_history(request, models.AuditEntry.objects.filter(field=self.audit_field, object_id=object_id))
+        page = self.paginate_queryset(entries)
+        return self.get_paginated_response(serializers.AuditEntrySerializer(page, many=True).data)
+
+def audit_history(request, queryset):
+    """Apply ?since= / ?until= (ISO datetimes) to audit entries, newest first."""
+    for param, lookup in (("since", "changed_at__gte"), ("until", "changed_at__lt")):
+        raw = request.query_params.get(param)
+        if raw:
+            value = parse_datetime(raw)
+            if value is None:
+                raise ValidationError({param: "must be an ISO 8601 datetime"})
+            queryset = queryset.filter(**{lookup: value})
+    return queryset.select_related("actor").order_by("-changed_at", "-id")
+
+
 # -------- Catalog --------
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.Product.objects.all().order_by("title")
     serializer_class = serializers.ProductSerializer
     permission_classes = [DefaultPerms]
-    filterset_fields = ["product_type", "is_active", "series", "artist"]
+    filterset_class = filters.ProductFilter
     search_fields = ["title", "sku", "description", "series", "artist"]
     ordering_fields = ["title", "created_at"]
 
-class ProductVariantViewSet(viewsets.ModelViewSet):
-    queryset = models.ProductVariant.objects.select_related("product").all()
+    def list(self, request, *args, **kwargs):
+        """?facets=product_type,series,artist,is_active,available adds counts under the other active filters."""
+        names = facets.requested(request)
+        response = super().list(request, *args, **kwargs)
+        if names:
+            response.data["facets"] = facets.counts(self, request, names)
+        return response
+
+class ProductVariantViewSet(AuditHistoryMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.ProductVariant.objects.select_related("product").order_by("product_id", "pk")
     serializer_class = serializers.ProductVariantSerializer
     permission_classes = [DefaultPerms]
+    audit_field = models.AuditEntry.Field.VARIANT_PRICE
     filterset_fields = ["product", "edition_size", "taxable"]
     search_fields = ["option_label", "product__title"]
     ordering_fields = ["price_cents", "edition_sold"]
 
-class MediaViewSet(viewsets.ModelViewSet):
-    queryset = models.Media.objects.select_related("product").all()
+class MediaViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.Media.objects.select_related("product").order_by("pk")
     serializer_class = serializers.MediaSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["product", "kind"]
     search_fields = ["alt_text", "product__title"]
 
+    def _threshold(self, request):
+        try:
+            return min(max(int(request.query_params.get("threshold", phash.DEFAULT_THRESHOLD)), 0), 32)
+        except ValueError:
+            raise ValidationError({"threshold": "must be an integer number of bits"})
+
+    def _matches(self, request, matches):
+        rows = self.get_queryset().in_bulk([m["media"] for m in matches])
+        return Response([
+            {"distance": {k: m[k] for k in ("phash", "dhash", "ahash")},
+             **serializers.MediaSerializer(rows[m["media"]], context={"request": request}).data}
+            for m in matches if m["media"] in rows
+        ])
+
+    @action(detail=True, methods=["get"])
+    def duplicates(self, request, pk=None):
+        """Other media whose image is perceptually the same (?threshold= pHash bits)."""
+        media = self.get_object()
+        return self._matches(request, phash.duplicates_of(media, self._threshold(request)))
+
+    @action(detail=False, methods=["post"], url_path="duplicates")
+    def find_duplicates(self, request):
+        """POST multipart `image` -> existing media it duplicates, before saving it anywhere."""
+        image = request.FILES.get("image")
+        if image is None:
+            raise ValidationError({"image": "Upload an image file"})
+        try:
+            hashes = phash.hashes(image)
+        except phash.UNREADABLE:
+            raise ValidationError({"image": "Not a readable image"})
+        return self._matches(request, phash.similar(hashes, self._threshold(request)))
+
+class MediaUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+                         mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """Resumable chunked upload of large scans into Media.image - see core.uploads for the protocol."""
+    queryset = models.MediaUpload.objects.select_related("product").order_by("-created_at")
+    serializer_class = serializers.MediaUploadSerializer
+    permission_classes = [DefaultPerms]
+    filterset_fields = {"product": ["exact"], "media": ["exact"], "completed_at": ["isnull"]}
+
+    @action(detail=True, methods=["put"], url_path=r"chunks/(?P<index>\d+)")
+    def chunk(self, request, pk=None, index=None):
+        # request.data is never touched, so DRF/Django don't buffer the body; read it as a stream
+        stream = request.stream or io.BytesIO()
+        upload = uploads.write_chunk(self.get_object().pk, int(index), stream, request.headers.get("X-Chunk-Sha256"))
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        media = uploads.complete(self.get_object().pk)
+        return Response(serializers.MediaSerializer(media, context=self.get_serializer_context()).data)
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+        instance.delete()
+
 # -------- Contacts / CRM --------
-class ContactViewSet(viewsets.ModelViewSet):
-    queryset = models.Contact.objects.all()
+class ContactViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.Contact.objects.order_by("name", "pk")
     serializer_class = serializers.ContactSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["kind"]
     search_fields = ["name", "email", "phone", "notes"]
 
-class CrmNoteViewSet(viewsets.ModelViewSet):
-    queryset = models.CrmNote.objects.select_related("contact").all()
+    @action(detail=True, methods=["get"])
+    def duplicates(self, request, pk=None):
+        contact = self.get_object()
+        return Response([
+            {"score": s, **serializers.ContactSerializer(c, context={"request": request}).data}
+            for s, c in dedupe.duplicates_of(contact)
+        ])
+
+    @action(detail=True, methods=["post"])
+    def merge(self, request, pk=None):
+        """POST {"duplicates": [ids]} -> fold those contacts into this one."""
+        keep = self.get_object()
+        body = serializers.ContactMergeSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        dups = list(models.Contact.objects.filter(pk__in=body.validated_data["duplicates"]).exclude(pk=keep.pk))
+        dedupe.merge_contacts(keep, dups)
+        return Response(serializers.ContactSerializer(keep, context={"request": request}).data)
+
+class CrmNoteViewSet(ArchiveFallbackMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.CrmNote.objects.select_related("contact").order_by("-created_at", "-pk")
     serializer_class = serializers.CrmNoteSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["contact"]
     search_fields = ["note", "contact__name"]
+    archive_queryset = models.ArchivedCrmNote.objects.order_by("-created_at", "-pk")
+    archive_serializer_class = serializers.ArchivedCrmNoteSerializer
+    archive_search_fields = ["note", "contact_name"]
 
 # -------- Locations / Inventory --------
-class LocationViewSet(viewsets.ModelViewSet):
-    queryset = models.Location.objects.all()
+class LocationViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.Location.objects.order_by("name", "pk")
     serializer_class = serializers.LocationSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["is_sellable"]
     search_fields = ["name"]
 
-class InventoryByLocationViewSet(viewsets.ModelViewSet):
-    queryset = models.InventoryByLocation.objects.select_related("variant", "location", "variant__product").all()
+class InventoryByLocationViewSet(AuditHistoryMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.InventoryByLocation.objects.select_related("variant", "location", "variant__product").order_by("pk")
     serializer_class = serializers.InventoryByLocationSerializer
     permission_classes = [DefaultPerms]
+    audit_field = models.AuditEntry.Field.INVENTORY_ON_HAND
     filterset_fields = ["variant", "location"]
     search_fields = ["variant__option_label", "variant__product__title", "location__name"]
 
+    @action(detail=False, methods=["post"])
+    def transfer(self, request):
+        """POST {"moves": [{"variant", "from_location", "to_location", "qty"}]} - all or nothing."""
+        payload = serializers.StockTransferSerializer(data=request.data)
+        payload.is_valid(raise_exception=True)
+        try:
+            return Response({"results": stock.transfer(payload.validated_data["moves"])})
+        except stock.InsufficientStock as exc:
+            # built here rather than as a ValidationError, which would turn the numbers into strings
+            return Response({"insufficient_stock": exc.lines}, status=400)
+
+    @action(detail=False, methods=["post"])
+    def count(self, request):
+        """POST {"counts": [{"variant", "location", "counted"}]} - sets on_hand, returns variances."""
+        payload = serializers.StockCountSerializer(data=request.data)
+        payload.is_valid(raise_exception=True)
+        return Response(stock.cycle_count(payload.validated_data["counts"]))
+
+class StockThresholdViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.StockThreshold.objects.select_related("variant", "location").order_by("pk")
+    serializer_class = serializers.StockThresholdSerializer
+    permission_classes = [DefaultPerms]
+    filterset_fields = ["variant", "location"]
+
+class StockAlertViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
+    """Maintained by core.alerts; ?resolved_at__isnull=true lists the open ones."""
+    queryset = models.StockAlert.objects.select_related("variant", "variant__product", "location").order_by("-updated_at")
+    serializer_class = serializers.StockAlertSerializer
+    permission_classes = [DefaultPerms]
+    filterset_fields = {"kind": ["exact"], "variant": ["exact"], "location": ["exact"], "resolved_at": ["isnull"]}
+    search_fields = ["variant__option_label", "variant__product__title", "location__name"]
+
 # -------- Orders / Payments --------
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = models.Order.objects.select_related("buyer_contact").prefetch_related("items").all()
+class OrderViewSet(AuditHistoryMixin, ArchiveFallbackMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.Order.objects.select_related("buyer_contact").prefetch_related("items").order_by("-created_at", "-pk")
     serializer_class = serializers.OrderSerializer
     permission_classes = [DefaultPerms]
-    filterset_fields = ["status", "channel", "buyer_contact"]
+    audit_field = models.AuditEntry.Field.ORDER_STATUS
+    filterset_fields = ["status", "channel", "buyer_contact", "consignment"]
     search_fields = ["id"]
     ordering_fields = ["created_at", "total_cents"]
+    archive_queryset = models.ArchivedOrder.objects.prefetch_related("items").order_by("-created_at", "-pk")
+    archive_serializer_class = serializers.ArchivedOrderSerializer
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        POST {"location": <id>, "orders": [{"client_key", "items": [...], "payments": [...], ...}]}
+        Idempotent by client_key: re-sending a batch reports the orders as duplicates.
+        Sales the location had no stock for come back as missing_inventory / oversold.
+        """
+        batch = serializers.OrderBatchSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+        result = ingest.ingest_orders(batch.validated_data["location"], batch.validated_data["orders"])
+        return Response(result, status=201 if result["created"] else 200)
 
-class OrderItemViewSet(viewsets.ModelViewSet):
-    queryset = models.OrderItem.objects.select_related("order", "variant", "variant__product").all()
+    @action(detail=True, methods=["get", "post"])
+    def tax(self, request, pk=None):
+        """GET: per-line tax from the current rate table. POST: also save it to tax_cents/total_cents."""
+        order = get_object_or_404(models.Order, pk=pk)  # live orders only; archived ones keep their tax
+        self.check_object_permissions(request, order)
+        return Response(tax.apply(order) if request.method == "POST" else tax.quote(order))
+
+class OrderItemViewSet(ArchiveFallbackMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.OrderItem.objects.select_related("order", "variant", "variant__product").order_by("pk")
     serializer_class = serializers.OrderItemSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["order", "variant"]
     search_fields = ["order__id", "variant__option_label"]
+    archive_queryset = models.ArchivedOrderItem.objects.order_by("pk")
+    archive_serializer_class = serializers.ArchivedOrderItemSerializer
+    archive_search_fields = ["order__id", "variant_label", "product_title"]
 
-class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = models.Payment.objects.select_related("order").all()
+class PaymentViewSet(ArchiveFallbackMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.Payment.objects.select_related("order").order_by("-received_at", "-pk")
     serializer_class = serializers.PaymentSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["method", "order"]
     search_fields = ["order__id"]
+    archive_queryset = models.ArchivedPayment.objects.order_by("-received_at", "-pk")
+    archive_serializer_class = serializers.ArchivedPaymentSerializer
+
+class TaxRateViewSet(viewsets.ModelViewSet):
+    queryset = models.TaxRate.objects.order_by("jurisdiction", "product_type", "valid_from")
+    serializer_class = serializers.TaxRateSerializer
+    permission_classes = [DefaultPerms]
+    filterset_fields = ["jurisdiction", "product_type"]
+    search_fields = ["jurisdiction"]
 
 # -------- COAs --------
-class CoaCertificateViewSet(viewsets.ModelViewSet):
-    queryset = models.CoaCertificate.objects.select_related("product", "variant", "purchaser_contact").all()
+class CoaCertificateViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.CoaCertificate.objects.select_related("product", "variant", "purchaser_contact").order_by("pk")
     serializer_class = serializers.CoaCertificateSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["product", "variant", "purchaser_contact"]
     search_fields = ["serial_no", "product__title", "variant__option_label"]
 
 # -------- Consignments --------
-class ConsignmentViewSet(viewsets.ModelViewSet):
-    queryset = models.Consignment.objects.select_related("gallery_contact").prefetch_related("items").all()
+class ConsignmentViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.Consignment.objects.select_related("gallery_contact").prefetch_related("items").order_by("-start_date", "-pk")
     serializer_class = serializers.ConsignmentSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["gallery_contact", "start_date"]
     search_fields = ["gallery_contact__name"]
 
-class ConsignmentItemViewSet(viewsets.ModelViewSet):
-    queryset = models.ConsignmentItem.objects.select_related("consignment", "variant", "variant__product").all()
+class ConsignmentItemViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = models.ConsignmentItem.objects.select_related("consignment", "variant", "variant__product").order_by("pk")
     serializer_class = serializers.ConsignmentItemSerializer
     permission_classes = [DefaultPerms]
     filterset_fields = ["consignment", "variant"]
     search_fields = ["consignment__id", "variant__option_label", "variant__product__title"]
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each row back instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+class SettlementViewSet(viewsets.ViewSet):
+    """
+    GET /api/settlements/?start=YYYY-MM-DD&end=YYYY-MM-DD[&gallery=<contact id>]
+    GET /api/settlements/statement/?...   (streamed CSV)
+    Defaults to month-to-date.
+    """
+    permission_classes = [DefaultPerms]
+
+    def _params(self, request):
+        qp = request.query_params
+        try:
+            end = parse_date(qp["end"]) if qp.get("end") else timezone.localdate()
+            start = parse_date(qp["start"]) if qp.get("start") else end and end.replace(day=1)
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            raise ValidationError({"detail": "start/end must be YYYY-MM-DD"})
+        if start > end:
+            raise ValidationError({"detail": "start must be on or before end"})
+        gallery = qp.get("gallery") or None
+        if gallery is not None:
+            try:
+                gallery = int(gallery)
+            except ValueError:
+                raise ValidationError({"gallery": "must be a contact id"})
+        return start, end, gallery
+
+    def list(self, request):
+        start, end, gallery = self._params(request)
+        return Response(settlement.settle(start, end, gallery=gallery))
+
+    @action(detail=False, methods=["get"])
+    def statement(self, request):
+        start, end, gallery = self._params(request)
+        writer = csv.writer(_Echo())
+
+        def rows():
+            yield writer.writerow(settlement.STATEMENT_COLUMNS)
+            # runs while the response streams, after the routing middleware has returned
+            with db_router.replica_reads():
+                data = settlement.consignment_rows(start, end, gallery=gallery)
+            for r in data:
+                yield writer.writerow([r[c] for c in settlement.STATEMENT_COLUMNS])
+
+        response = StreamingHttpResponse(rows(), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="settlement_{start}_{end}.csv"'
+        return response
+
+
+class AuditEntryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Audit history across objects: ?field=<1 price|2 on_hand|3 status>&object_id=
+    &actor=&source=&since=&until=. Indexed on (field, object_id, changed_at) and changed_at.
+    """
+    queryset = models.AuditEntry.objects.all()
+    serializer_class = serializers.AuditEntrySerializer
+    permission_classes = [DefaultPerms]
+    filterset_fields = ["field", "object_id", "actor", "source"]
+    ordering_fields = ["changed_at"]
+
+    def get_queryset(self):
+        return audit_history(self.request, super().get_queryset())
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    GET /api/sync/?since=<token>[&limit=N]
+    Rows of products/variants/inventory/media changed after `since` (0 = everything),
+    with tombstones for deletes. Keep calling with the returned token while has_more.
+    410 {"resync": true} when the token is older than the compacted feed: drop local
+    state and start again from 0.
+    """
+    permission_classes = [DefaultPerms]
+
+    def list(self, request):
+        try:
+            since = int(request.query_params.get("since", "0"))
+            limit = int(request.query_params.get("limit", sync.DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({"detail": "since and limit must be integers"})
+        try:
+            return Response(sync.changes_since(since, limit=limit, request=request))
+        except sync.StaleToken as exc:
+            return Response({"detail": str(exc), "resync": True, "horizon": str(exc.horizon)}, status=410)
@@ -0,0 +1,123 @@
+"""
+Async read-only mirror of the catalog/inventory viewsets, for ASGI workers
+(gunicorn -k uvicorn_worker.UvicornWorker config.asgi:application).
+
+Authentication, permissions, throttling, filtering, search, ordering,
+pagination (?page=, ?page_size=), product ?facets= and renderer negotiation
+(Accept / ?format=msgpack) run through the same DRF classes and viewset
+configuration as /api/, so the same query string returns the same data;
+only the DB round trips (count, page fetch, detail get) are awaited. The
+browsable API (?format=api) is not served here: 406.
+"""
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.views import View
+from rest_framework.exceptions import NotAcceptable, NotFound
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import facets, views_api
+
+
+class AsyncReadView(View):
+    viewset = None  # the views_api.ModelViewSet whose read semantics we mirror
+    facets = False  # whether the viewset's list honours ?facets= (see views_api.ProductViewSet.list)
+    http_method_names = ["get", "head", "options"]
+
+    def _viewset(self, request, action):
+        view = self.viewset(format_kwarg=None, action_map={"get": action, "head": action}, kwargs=self.kwargs,
+                            args=(), headers={})
+        # with the viewset's authenticators, parsers and negotiator, as APIView.dispatch builds it
+        view.request = view.initialize_request(request)
+        # the browsable API renders forms through sync viewset calls; data formats only here
+        view.renderer_classes = [r for r in view.renderer_classes if not issubclass(r, BrowsableAPIRenderer)]
+        return view
+
+    def _filtered_queryset(self, view):
+        queryset = view.get_queryset()
+        for backend in api_settings.DEFAULT_FILTER_BACKENDS:
+            queryset = backend().filter_queryset(view.request, queryset, view)
+        return queryset
+
+    def _serialize(self, request, data, many=False):
+        serializer = self.viewset.serializer_class(data, many=many, context={"request": request})
+        return serializer.data
+
+    @staticmethod
+    def _initial(view):
+        """APIView.initial(): negotiation, authentication, permission and throttle checks."""
+        fmt = view.request.query_params.get(api_settings.URL_FORMAT_OVERRIDE)
+        if fmt and fmt not in {renderer.format for renderer in view.renderer_classes}:
+            raise NotAcceptable(f"?format={fmt} is not served under /api/async/")
+        view.initial(view.request)
+
+    async def get(self, request, pk=None):
+        view = self._viewset(request, "list" if pk is None else "retrieve")
+        try:
+            # authentication may hit the session table, so this runs off the event loop too
+            await sync_to_async(self._initial)(view)
+            if pk is not None:
+                data = await self.retrieve(view, request, pk)
+            else:
+                data = await self.list(view, request)
+            response = Response(data)
+        except Exception as exc:
+            # same error responses (status, auth headers, Retry-After) as the sync viewset
+            response = view.handle_exception(exc)
+        return view.finalize_response(view.request, response).render()
+
+    def _page(self, view, queryset, count):
+        """The pagination_class page for `queryset` given its awaited count (no query is run here)."""
+        paginator = view.paginator
+        page_size = paginator.get_page_size(view.request)
+        django_paginator = paginator.django_paginator_class(queryset, page_size)
+        django_paginator.count = count  # cached_property; skips the sync COUNT
+        page_number = paginator.get_page_number(view.request, django_paginator)
+        try:
+            page = django_paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        paginator.page, paginator.request = page, view.request
+        return paginator, page
+
+    async def list(self, view, request):
+        # building the filterset may validate FK choices against the DB, so keep it off the event loop
+        queryset = await sync_to_async(self._filtered_queryset)(view)
+
+        if view.paginator is None or view.paginator.get_page_size(view.request) is None:
+            rows = [obj async for obj in queryset.aiterator()]
+            return self._serialize(request, rows, many=True)
+
+        paginator, page = self._page(view, queryset, await queryset.acount())
+        page.object_list = [obj async for obj in page.object_list.aiterator()]
+        data = paginator.get_paginated_response(self._serialize(request, page.object_list, many=True)).data
+        names = facets.requested(view.request) if self.facets else []
+        if names:
+            data["facets"] = await sync_to_async(facets.counts)(view, view.request, names)
+        return data
+
+    async def retrieve(self, view, request, pk):
+        queryset = view.get_queryset()
+        try:
+            obj = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise NotFound()
+        return self._serialize(request, obj)
+
+
+class AsyncProductView(AsyncReadView):
+    viewset = views_api.ProductViewSet
+    facets = True
+
+
+class AsyncProductVariantView(AsyncReadView):
+    viewset = views_api.ProductVariantViewSet
+
+
+class AsyncMediaView(AsyncReadView):
+    viewset = views_api.MediaViewSet
+
+
+class AsyncInventoryByLocationView(AsyncReadView):
+    viewset = views_api.InventoryByLocationViewSet
@@ -0,0 +1,50 @@
+"""
+Gunicorn settings (picked up automatically from the working directory).
+
+Serves config.settings_production unless DJANGO_SETTINGS_MODULE says otherwise;
+that profile keeps DRF and django-filter out of django.setup(), which is what
+management commands and cron pay for. The web server does need them, so the
+app is imported once in the master (preload_app) and warmed up before workers
+fork: Django, DRF, django-filter and the URL resolver then live in pages shared
+copy-on-write instead of being rebuilt in every worker.
+Profile cold start with `python manage.py profile_startup [--settings=...]`.
+"""
+import gc
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings_production")
+
+# GUNICORN_ASGI=1 runs uvicorn workers on config.asgi so the async /api/async/ views
+# can interleave many slow connections per worker.
+if os.environ.get("GUNICORN_ASGI") == "1":
+    wsgi_app = "config.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "config.wsgi:application"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+preload_app = True
+# recycle workers now and then so slow leaks don't erode the shared pages
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = 100
+
+
+def when_ready(server):
+    from django.db import connections
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+
+    # import everything that is otherwise loaded lazily on the first request, so
+    # it is paid for once here rather than per worker after fork
+    get_resolver().url_patterns
+    api_settings.DEFAULT_FILTER_BACKENDS
+    api_settings.DEFAULT_RENDERER_CLASSES
+    api_settings.DEFAULT_PARSER_CLASSES
+    api_settings.DEFAULT_PAGINATION_CLASS
+
+    # never hand a master-side DB connection to forked workers
+    connections.close_all()
+    # keep the GC from touching (and so un-sharing) objects created before fork
+    gc.collect()
+    gc.freeze()